@@ -0,0 +1,95 @@
+"""Before/after benchmark for the (user_id, date) index and duration_hours.
+
+Builds a synthetic sleep_log on SQLite twice: once at schema version 3
+(no index, duration recomputed per row) and once fully migrated, then
+times the per-user history query on each and prints the query plans.
+Exits with an error if the migrated plan does not use the index.
+
+    python -m benchmarks.bench_sleep_log_index --rows 1000000
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+
+from benchmarks.synthetic import populate
+from sleep_monitor import db, loader, migrations
+
+
+def _legacy_query(backend):
+    sleep_sec = backend.time_to_sec("sleep_time")
+    wake_sec = backend.time_to_sec("wake_time")
+    return backend.sql(f"""
+        SELECT
+            id, date, sleep_time, wake_time, sleep_quality, notes,
+            CASE
+                WHEN {wake_sec} < {sleep_sec}
+                THEN ({wake_sec} + 86400 - {sleep_sec}) / 3600.0
+                ELSE ({wake_sec} - {sleep_sec}) / 3600.0
+            END as duration
+        FROM sleep_log
+        WHERE user_id = %s AND id > %s
+        ORDER BY date DESC, id DESC
+    """)
+
+
+def _time_query(query, user_ids, repeat, tiers=1):
+    timings = []
+    with db.cursor() as cursor:
+        for _ in range(repeat):
+            for user_id in user_ids:
+                start = time.perf_counter()
+                cursor.execute(query, (user_id, 0) * tiers)
+                cursor.fetchall()
+                timings.append(time.perf_counter() - start)
+    return timings
+
+
+def run(rows, users, repeat):
+    days = rows // users
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, target in (("before", 3), ("after", None)):
+            backend = db.SQLiteBackend(os.path.join(tmp, f"{label}.db"))
+            db.configure(backend, size=1)
+            migrations.migrate(target=target)
+            user_ids = populate(users, days, with_rollups=target is None)
+            with db.cursor(commit=True) as cursor:
+                cursor.execute("ANALYZE")
+            if target:
+                query, tiers = _legacy_query(backend), 1
+                with db.cursor() as cursor:
+                    cursor.execute(backend.explain(query), (user_ids[0], 0))
+                    plan = [" ".join(str(col) for col in row) for row in cursor.fetchall()]
+            else:
+                # The current query also reads the (empty) archive tier, with its own parameters
+                query, tiers = loader._history_query(), 2
+                plan = loader.explain(user_ids[0])
+                if not loader.uses_user_date_index(user_ids[0]):
+                    raise SystemExit("history query does not use idx_sleep_log_user_date:\n"
+                                     + "\n".join(plan))
+            sample = user_ids[:: max(1, len(user_ids) // 20)]
+            timings = _time_query(query, sample, repeat, tiers)
+            results[label] = {
+                "rows": users * days,
+                "plan": plan,
+                "median_ms": statistics.median(timings) * 1000,
+                "p95_ms": sorted(timings)[int(len(timings) * 0.95)] * 1000,
+            }
+    results["speedup"] = results["before"]["median_ms"] / results["after"]["median_ms"]
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    print(json.dumps(run(args.rows, args.users, args.repeat), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Cold-start cost of the dashboard, measured in fresh interpreters.
+
+Every stage runs in a new Python process so nothing is already imported:
+
+* ``import.login``      -- the modules sleep_dashboard.py imports up front
+* ``import.dashboard``  -- the analytics stack loaded once a user logs in
+* ``render.login``      -- first AppTest run of the login page
+* ``render.dashboard``  -- first AppTest run of a logged-in session
+
+Each result also lists which heavy modules the stage left loaded, so the
+login page pulling pandas back in shows up as well as a slowdown.  The
+output has the run_benchmarks layout, so it can be compared the same way:
+
+    python -m benchmarks.bench_startup --output startup.json
+    python -m benchmarks.run_benchmarks --compare base.json startup.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+
+from benchmarks.run_benchmarks import _commit
+from benchmarks.synthetic import populate
+from sleep_monitor import db, migrations
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ["pandas", "numpy", "plotly.express", "pyarrow", "mysql.connector"]
+
+_PRELUDE = f"""
+import json, sys, time
+sys.path.insert(0, {ROOT!r})
+start = time.perf_counter()
+"""
+
+_REPORT = f"""
+print(json.dumps({{"seconds": time.perf_counter() - start,
+                  "modules": [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))
+"""
+
+_APP = f"""
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file({os.path.join(ROOT, "sleep_dashboard.py")!r}, default_timeout=120)
+"""
+
+STAGES = {
+    "import.login": "import streamlit\nfrom sleep_monitor import db, migrations, style, write_queue\n",
+    "import.dashboard": "import streamlit\nfrom sleep_monitor import dashboard_page\n",
+    # AppTest is imported before the clock starts; only the script run is timed
+    "render.login": _APP + "start = time.perf_counter()\napp.run()\nassert not app.exception\n",
+    "render.dashboard": _APP + "app.session_state['user_id'] = {user_id}\n"
+                               "app.session_state['page'] = 'dashboard'\n"
+                               "start = time.perf_counter()\napp.run()\nassert not app.exception\n",
+}
+
+
+def _run_stage(code, env):
+    output = subprocess.run([sys.executable, "-c", _PRELUDE + code + _REPORT], env=env, cwd=ROOT,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run(years, repeat):
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "startup.db")
+        db.configure(db.SQLiteBackend(path), size=1)
+        migrations.migrate()
+        user_id = populate(1, years * 365)[0]
+        env = dict(os.environ, SLEEP_DB_BACKEND="sqlite", SLEEP_DB_PATH=path, SLEEP_PROFILE="0")
+        for name, code in STAGES.items():
+            reports = [_run_stage(code.format(user_id=user_id), env) for _ in range(repeat)]
+            timings = [report["seconds"] for report in reports]
+            results.append({
+                "benchmark": name,
+                "users": 1,
+                "years": years,
+                "median_ms": statistics.median(timings) * 1000,
+                "min_ms": min(timings) * 1000,
+                "repeat": repeat,
+                "heavy_modules": reports[-1]["modules"],
+            })
+            print(f"{name:<18} {results[-1]['median_ms']:9.1f} ms  "
+                  f"{', '.join(results[-1]['heavy_modules']) or '-'}", file=sys.stderr)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark dashboard cold start.")
+    parser.add_argument("--years", type=int, default=1, help="history of the logged-in user")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default="benchmark_results.json")
+    args = parser.parse_args(argv)
+
+    report = {
+        "meta": {
+            "commit": _commit(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "backend": "sqlite",
+        },
+        "results": run(args.years, args.repeat),
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"wrote {args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
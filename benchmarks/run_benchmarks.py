@@ -0,0 +1,166 @@
+"""Reproducible benchmarks for the dashboard data pipeline.
+
+For each (users x years) size a fresh SQLite database is filled with
+synthetic nights, then every pipeline stage is timed on one user's data.
+Results are written as JSON so two commits can be compared:
+
+    python -m benchmarks.run_benchmarks --users 20 --years 1 5 10 --output base.json
+    python -m benchmarks.run_benchmarks --compare base.json new.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.synthetic import populate
+from sleep_monitor import charts, cohort, db, loader, metrics, migrations, retention, rolling
+from sleep_monitor.cache import user_cache
+
+
+def _measure(func, repeat, setup=None):
+    timings = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def _stages(user_id, first, last):
+    """(name, callable, setup) for each timed stage of a dashboard rerun."""
+    history = loader.load_user_data(user_id)
+    window_start = max(first, last - timedelta(days=89))
+
+    def cold():
+        user_cache.invalidate(user_id)
+
+    def cohort_build():
+        with db.cursor(commit=True) as cursor:
+            cohort.build(cursor)
+
+    def all_figures():
+        charts.trend_line(history, 'duration', 'Sleep Duration Trend', 'Hours')
+        charts.trend_line(history, 'sleep_quality', 'Sleep Quality Trend', 'Quality (1-5)')
+        charts.duration_histogram(history)
+        charts.quality_scatter(history)
+        result = metrics.calculate_sleep_metrics(history)
+        charts.weekly_bar(result['weekly_pattern'])
+        charts.quality_bar(result['quality_dist'])
+
+    return [
+        ("load_user_data.cold", lambda: loader.load_user_data(user_id), cold),
+        ("load_user_data.warm", lambda: loader.load_user_data(user_id), None),
+        ("load_window.sql_90d", lambda: loader.load_window(user_id, window_start, last), cold),
+        ("load_window.sql_all", lambda: loader.load_window(user_id, first, last), cold),
+        ("date_range_filter.in_memory",
+         lambda: history[(history['date'] >= str(window_start)) & (history['date'] <= str(last))], None),
+        ("date_bounds", lambda: loader.date_bounds(user_id), cold),
+        ("calculate_sleep_metrics", lambda: metrics.calculate_sleep_metrics(history), None),
+        ("window_metrics.rollups_90d", lambda: metrics.window_metrics(user_id, window_start, last), cold),
+        ("window_metrics.rollups_all", lambda: metrics.window_metrics(user_id, first, last), cold),
+        ("rolling.replay", lambda: rolling.SleepTrends.from_frame(history), None),
+        ("create_sleep_heatmap", lambda: metrics.create_sleep_heatmap(history), None),
+        ("cohort.build", cohort_build, None),
+        ("cohort.standing", lambda: cohort.standing(user_id), cold),
+        ("figures.build", all_figures, charts._figures.clear),
+        ("figures.cached", all_figures, None),
+    ]
+
+
+def run(users, years_list, repeat, hot_days=None):
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for years in years_list:
+            db.configure(db.SQLiteBackend(os.path.join(tmp, f"bench-{years}.db")), size=2)
+            migrations.migrate()
+            user_ids = populate(users, years * 365, seed=years)
+            first, last, nights = loader.date_bounds(user_ids[0])
+            if hot_days is not None:
+                # Older nights move to the archive tier, as after a nightly compaction
+                retention.compact(hot_days, today=last + timedelta(days=1))
+            for name, func, setup in _stages(user_ids[0], first, last):
+                timings = _measure(func, repeat, setup)
+                results.append({
+                    "benchmark": name,
+                    "users": users,
+                    "years": years,
+                    "rows_total": users * years * 365,
+                    "rows_user": nights,
+                    "median_ms": statistics.median(timings) * 1000,
+                    "min_ms": min(timings) * 1000,
+                    "repeat": repeat,
+                })
+                print(f"{years:>3}y {name:<30} {results[-1]['median_ms']:9.2f} ms", file=sys.stderr)
+    return results
+
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(base_path, new_path, threshold):
+    """Print median ratios new/base; returns 1 if any stage regressed past ``threshold``."""
+    with open(base_path) as f:
+        base = {(r["benchmark"], r["users"], r["years"]): r for r in json.load(f)["results"]}
+    with open(new_path) as f:
+        new = json.load(f)["results"]
+    regressed = False
+    for result in new:
+        key = (result["benchmark"], result["users"], result["years"])
+        if key not in base:
+            continue
+        ratio = result["median_ms"] / max(base[key]["median_ms"], 1e-9)
+        flag = "  REGRESSION" if ratio > threshold else ""
+        regressed = regressed or bool(flag)
+        print(f"{key[2]:>3}y {key[0]:<30} {base[key]['median_ms']:9.2f} -> "
+              f"{result['median_ms']:9.2f} ms  x{ratio:.2f}{flag}")
+    return 1 if regressed else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the dashboard data pipeline.")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--years", type=int, nargs="+", default=[1, 5, 10])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--hot-days", type=int, default=None,
+                        help="archive nights older than this before timing (default: no compaction)")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"))
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="ratio above which --compare reports a regression")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        return compare(*args.compare, args.threshold)
+
+    report = {
+        "meta": {
+            "commit": _commit(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "backend": "sqlite",
+            "hot_days": args.hot_days,
+        },
+        "results": run(args.users, args.years, args.repeat, args.hot_days),
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"wrote {args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
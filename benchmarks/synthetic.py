@@ -0,0 +1,71 @@
+"""Synthetic sleep_log data for benchmarks."""
+import random
+from datetime import date, time, timedelta
+
+from sleep_monitor import db
+from sleep_monitor.writes import INSERT_SLEEP_LOG, insert_nights
+
+NOTES = [
+    "Woke up once during the night",
+    "Late coffee, hard to fall asleep",
+    "Felt rested",
+    "Noisy neighbours",
+    "Workout in the evening",
+    "Read before bed",
+]
+
+
+def generate_rows(user_ids, days, start=date(2020, 1, 1), seed=42):
+    """Yield one plausible sleep_log row per user per night."""
+    rng = random.Random(seed)
+    for user_id in user_ids:
+        # Each user has a habitual bedtime around which nights vary
+        habit = rng.gauss(23 * 60, 45)
+        for day in range(days):
+            bedtime = int(habit + rng.gauss(0, 40)) % (24 * 60)
+            duration = max(60, min(12 * 60, int(rng.gauss(7.3 * 60, 60))))
+            wake = (bedtime + duration) % (24 * 60)
+            quality = max(1, min(5, round(1 + (duration - 240) / 90 + rng.gauss(0, 0.8))))
+            notes = rng.choice(NOTES) if rng.random() < 0.15 else None
+            yield (
+                user_id,
+                start + timedelta(days=day),
+                time(bedtime // 60, bedtime % 60),
+                time(wake // 60, wake % 60),
+                quality,
+                notes,
+            )
+
+
+def populate(users, days, seed=42, chunk_size=10000, with_rollups=True):
+    """Insert ``users`` accounts with ``days`` nights each; returns their ids.
+
+    Pass ``with_rollups=False`` for schemas older than the sleep_rollup and
+    cohort tables; the rows are then inserted without updating either.
+    """
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        user_ids = []
+        for n in range(users):
+            cursor.execute(
+                db.sql("INSERT INTO users (username, password) VALUES (%s, %s)"),
+                (f"bench-{seed}-{n}", "bench"),
+            )
+            user_ids.append(cursor.lastrowid)
+        batch = []
+        for row in generate_rows(user_ids, days, seed=seed):
+            batch.append(row)
+            if len(batch) >= chunk_size:
+                _insert(cursor, batch, with_rollups)
+                batch.clear()
+        _insert(cursor, batch, with_rollups)
+        conn.commit()
+        cursor.close()
+    return user_ids
+
+
+def _insert(cursor, rows, with_rollups):
+    if with_rollups:
+        insert_nights(cursor, rows)
+    elif rows:
+        cursor.executemany(db.sql(INSERT_SLEEP_LOG), rows)
@@ -0,0 +1 @@
+"""Support modules for the Sleep Monitor dashboard."""
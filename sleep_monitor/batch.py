@@ -0,0 +1,188 @@
+"""Headless nightly metrics for every user.
+
+User ids are split into contiguous ranges and fanned out over a process
+pool.  Each worker streams its range's sleep_log rows with one ordered
+query, computes ``calculate_sleep_metrics`` per user as the rows arrive and
+upserts the results into ``user_metrics``.  Workers share nothing but the
+database, so throughput grows with the number of cores.
+
+Once every range is done the cohort percentile sketches are rebuilt
+(``sleep_monitor.cohort.build``), which also clears the deltas appended
+since the last run.  Schedule this nightly:
+
+    python -m sleep_monitor.batch --workers 8
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import numpy as np
+
+from sleep_monitor import cohort, db, migrations, records, retention
+from sleep_monitor.metrics import calculate_sleep_metrics
+
+USERS_PER_TASK = 200
+FETCH_SIZE = 10000
+
+SUMMARY_COLUMNS = ['user_id', 'nights', 'first_date', 'last_date', 'avg_duration',
+                   'duration_std', 'avg_quality', 'quality_std', 'sleep_time_std',
+                   'efficiency', 'weekly_pattern', 'quality_dist', 'computed_at']
+
+
+def _range_query(backend):
+    # Notes are not needed for the metrics, so they are never transferred
+    columns = f"""
+            user_id,
+            id,
+            date,
+            {backend.time_to_sec("sleep_time")} AS sleep_sec,
+            {backend.time_to_sec("wake_time")} AS wake_sec,
+            duration_hours,
+            sleep_quality,
+            NULL AS notes
+    """
+    return db.sql(f"""
+        SELECT * FROM {retention.union(columns, "user_id BETWEEN %s AND %s")}
+        ORDER BY user_id, date DESC, id DESC
+    """)
+
+
+def _number(value):
+    # NaN (too few nights for a std) is stored as NULL
+    return None if value is None or np.isnan(value) else float(value)
+
+
+def summary_row(user_id, df, computed_at):
+    """One ``user_metrics`` row for a user's compact frame."""
+    metrics = calculate_sleep_metrics(df)
+    weekly = metrics['weekly_pattern']
+    quality = metrics['quality_dist']
+    return (
+        user_id,
+        len(df),
+        df['date'].min().date(),
+        df['date'].max().date(),
+        _number(metrics['avg_duration']),
+        _number(metrics['duration_std']),
+        _number(metrics['avg_quality']),
+        _number(metrics['quality_std']),
+        _number(metrics['sleep_time_std']),
+        _number(metrics['efficiency']),
+        json.dumps(dict(zip(weekly['weekday'], weekly['duration'].round(4).tolist()))),
+        json.dumps(dict(zip(quality['quality'].astype(str), quality['percentage'].round(4).tolist()))),
+        computed_at,
+    )
+
+
+def _stream_users(cursor):
+    """Yield ``(user_id, rows)`` from a cursor ordered by user_id."""
+    current, rows = None, []
+    while True:
+        batch = cursor.fetchmany(FETCH_SIZE)
+        if not batch:
+            break
+        for row in batch:
+            if row[0] != current:
+                if rows:
+                    yield current, rows
+                current, rows = row[0], []
+            rows.append(row[1:])
+    if rows:
+        yield current, rows
+
+
+def process_range(first_user, last_user):
+    """Compute and store metrics for users ``first_user``..``last_user``; returns the count."""
+    backend = db.get_backend()
+    computed_at = datetime.now().replace(microsecond=0)
+    results = []
+    with db.connection() as conn:
+        cursor = backend.streaming_cursor(conn)
+        try:
+            cursor.execute(_range_query(backend), (first_user, last_user) * 2)
+            for user_id, rows in _stream_users(cursor):
+                results.append(summary_row(user_id, records.from_rows(rows), computed_at))
+        finally:
+            cursor.close()
+        if results:
+            cursor = conn.cursor()
+            try:
+                cursor.executemany(db.sql(backend.upsert("user_metrics", SUMMARY_COLUMNS, ["user_id"])),
+                                   results)
+                conn.commit()
+            finally:
+                cursor.close()
+    return len(results)
+
+
+def user_ranges(user_ids, users_per_task=USERS_PER_TASK):
+    """Contiguous ``(first, last)`` id ranges of at most ``users_per_task`` users."""
+    return [(chunk[0], chunk[-1])
+            for chunk in (user_ids[i:i + users_per_task]
+                          for i in range(0, len(user_ids), users_per_task))]
+
+
+def _active_users():
+    with db.cursor() as cursor:
+        cursor.execute(f"SELECT DISTINCT user_id FROM {retention.union('user_id', '1 = 1')} ORDER BY user_id")
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _init_worker(backend):
+    # Each worker opens its own connection; nothing is inherited from the parent
+    db.configure(backend, size=1)
+
+
+def run(workers=None, users_per_task=USERS_PER_TASK, progress=None, rebuild_cohort=True):
+    """Refresh ``user_metrics`` for every user with data; returns the number of users.
+
+    With ``rebuild_cohort`` the cohort sketches are rebuilt afterwards.
+    """
+    migrations.ensure_schema()
+    ranges = user_ranges(_active_users(), users_per_task)
+    workers = workers or os.cpu_count() or 1
+    done = 0
+    if workers == 1 or len(ranges) <= 1:
+        for first, last in ranges:
+            done += process_range(first, last)
+            if progress:
+                progress(done)
+    else:
+        # Spawned workers start clean rather than sharing the parent's open connections
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_init_worker, initargs=(db.get_backend(),)) as pool:
+            for future in as_completed([pool.submit(process_range, *bounds) for bounds in ranges]):
+                done += future.result()
+                if progress:
+                    progress(done)
+    if rebuild_cohort:
+        with db.cursor(commit=True) as cursor:
+            cohort.build(cursor)
+    return done
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compute sleep metrics for all users.")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes (default: one per core)")
+    parser.add_argument("--users-per-task", type=int, default=USERS_PER_TASK)
+    parser.add_argument("--no-cohort", action="store_true",
+                        help="skip rebuilding the cohort percentile sketches")
+    args = parser.parse_args(argv)
+
+    def report(done):
+        print(f"\r{done} users", end="", file=sys.stderr)
+
+    start = time.perf_counter()
+    done = run(args.workers, args.users_per_task, progress=report, rebuild_cohort=not args.no_cohort)
+    print(f"\r{done} users in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
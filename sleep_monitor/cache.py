@@ -0,0 +1,95 @@
+"""Per-user result cache with memory-bounded LRU eviction.
+
+Entries are stamped with the user's data version when stored.  Writes call
+``bump(user_id)``, which makes every entry stored under an older version a
+miss on the next lookup, so a save is visible immediately.
+"""
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+
+def _sizeof(value):
+    if isinstance(value, tuple):
+        return sum(_sizeof(item) for item in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(_sizeof(item) for item in value.values())
+    if hasattr(value, "memory_usage"):
+        return int(value.memory_usage(deep=True).sum())
+    return sys.getsizeof(value)
+
+
+class UserDataCache:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # (user_id, key) -> (version, value, nbytes)
+        self._versions = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def version(self, user_id):
+        return self._versions.get(user_id, 0)
+
+    def bump(self, user_id):
+        """Advance the user's data version after a write."""
+        with self._lock:
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            return self._versions[user_id]
+
+    def get(self, user_id, key):
+        with self._lock:
+            entry = self._entries.get((user_id, key))
+            if entry is None or entry[0] != self._versions.get(user_id, 0):
+                self.misses += 1
+                return None
+            self._entries.move_to_end((user_id, key))
+            self.hits += 1
+            return entry[1]
+
+    def peek(self, user_id, key):
+        """Return ``(version, value)`` even if stale, without touching counters."""
+        with self._lock:
+            entry = self._entries.get((user_id, key))
+            return None if entry is None else entry[:2]
+
+    def put(self, user_id, key, value, version=None):
+        nbytes = _sizeof(value)
+        with self._lock:
+            if version is None:
+                version = self._versions.get(user_id, 0)
+            old = self._entries.pop((user_id, key), None)
+            if old is not None:
+                self._bytes -= old[2]
+            if nbytes > self.max_bytes:
+                return
+            self._entries[(user_id, key)] = (version, value, nbytes)
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes:
+                _, (_, _, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+                self.evictions += 1
+
+    def invalidate(self, user_id):
+        with self._lock:
+            for entry_key in [k for k in self._entries if k[0] == user_id]:
+                self._bytes -= self._entries.pop(entry_key)[2]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+user_cache = UserDataCache(int(os.environ.get("SLEEP_CACHE_MAX_MB", "64")) * 1024 * 1024)
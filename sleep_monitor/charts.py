@@ -0,0 +1,234 @@
+"""Cached, size-bounded Plotly figures for the dashboard.
+
+Figures are keyed by a fingerprint of the exact arrays they plot, so a
+rerun with unchanged data reuses the built (and themed) figure.  Trend lines
+are downsampled with LTTB above ``MAX_POINTS`` and large scatters switch to
+WebGL, which keeps both render time and the JSON sent to the browser
+bounded however long the history is.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import plotly.express as px
+
+from sleep_monitor import profiling, records
+
+MAX_POINTS = int(os.environ.get("SLEEP_CHART_MAX_POINTS", "1000"))
+WEBGL_THRESHOLD = int(os.environ.get("SLEEP_CHART_WEBGL_THRESHOLD", "1000"))
+CACHE_SIZE = 128
+
+CHART_CONFIG = {'displayModeBar': False}
+
+
+# Custom plot theme
+def apply_plot_theme(fig, height=400):
+    fig.update_layout(
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(0,0,0,0)',
+        font=dict(
+            family="system-ui, -apple-system, 'Segoe UI', Roboto, sans-serif",
+            size=12,
+            color="#FFFFFF"
+        ),
+        xaxis=dict(
+            gridcolor='rgba(255,255,255,0.1)',
+            zerolinecolor='rgba(255,255,255,0.1)'
+        ),
+        yaxis=dict(
+            gridcolor='rgba(255,255,255,0.1)',
+            zerolinecolor='rgba(255,255,255,0.1)'
+        ),
+        margin=dict(l=20, r=20, t=40, b=20),
+        height=height,
+        showlegend=True,
+        legend=dict(
+            bgcolor='rgba(0,0,0,0)',
+            bordercolor='rgba(255,255,255,0.1)',
+            borderwidth=1
+        )
+    )
+    return fig
+
+
+# Figure cache
+_figures = OrderedDict()
+_lock = threading.Lock()
+stats = {"hits": 0, "misses": 0}
+
+
+def fingerprint(*arrays):
+    digest = hashlib.blake2b(digest_size=16)
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        digest.update(str(array.dtype).encode())
+        digest.update(array.tobytes() if array.dtype != object else repr(array.tolist()).encode())
+    return digest.hexdigest()
+
+
+def _cached(key, build):
+    with _lock:
+        fig = _figures.get(key)
+        if fig is not None:
+            _figures.move_to_end(key)
+            stats["hits"] += 1
+            return fig
+        stats["misses"] += 1
+    with profiling.span(f"chart.build.{key[0]}"):
+        fig = build()
+    with _lock:
+        _figures[key] = fig
+        while len(_figures) > CACHE_SIZE:
+            _figures.popitem(last=False)
+    return fig
+
+
+# Downsampling
+def lttb(x, y, threshold):
+    """Indices of the points kept by Largest-Triangle-Three-Buckets."""
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    keep = np.empty(threshold, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # Average of the next bucket is the third triangle vertex
+        nlo, nhi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        cx, cy = x[nlo:nhi].mean(), y[nlo:nhi].mean()
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(area.argmax())
+        keep[i + 1] = a
+    return keep
+
+
+def _trend_points(df, column):
+    frame = df if column != 'sleep_quality' else df[df['sleep_quality'] != records.UNRATED]
+    frame = frame.sort_values('date')
+    dates = frame['date'].to_numpy()
+    values = frame[column].to_numpy()
+    keep = lttb(dates.astype('datetime64[s]').astype(np.int64), values, MAX_POINTS)
+    return dates[keep], values[keep]
+
+
+# Figures
+def quality_pie(quality_counts):
+    key = ("pie", fingerprint(quality_counts['sleep_quality'], quality_counts['nights']))
+    return _cached(key, lambda: apply_plot_theme(
+        px.pie(quality_counts, names='sleep_quality', values='nights',
+               title='Sleep Quality Distribution',
+               color_discrete_sequence=px.colors.sequential.Plasma_r),
+        height=300))
+
+
+def trend_line(df, column, title, label):
+    key = ("trend", column, title, fingerprint(df['date'], df[column]))
+
+    def build():
+        dates, values = _trend_points(df, column)
+        return apply_plot_theme(
+            px.line(x=dates, y=values, title=title,
+                    labels={'y': label, 'x': 'Date'}),
+            height=400)
+
+    return _cached(key, build)
+
+
+def duration_trend(df, trends):
+    """Nightly duration with the rolling averages from ``rolling.load_trends`` overlaid."""
+    overlays = [(f'avg_{days}', f'{days}-day average') for days in (7, 30)]
+    key = ("duration_trend", fingerprint(df['date'], df['duration'], trends['date'],
+                                         *(trends[column] for column, _ in overlays)))
+
+    def build():
+        dates, values = _trend_points(df, 'duration')
+        fig = px.line(x=dates, y=values, title='Sleep Duration Trend',
+                      labels={'y': 'Hours', 'x': 'Date'})
+        fig.update_traces(name='Nightly', showlegend=True, opacity=0.5)
+        for column, label in overlays:
+            x, y = _trend_points(trends, column)
+            fig.add_scatter(x=x, y=y, mode='lines', name=label)
+        return apply_plot_theme(fig, height=400)
+
+    return _cached(key, build)
+
+
+def weekly_bar(weekly_pattern):
+    key = ("weekly", fingerprint(weekly_pattern['weekday'], weekly_pattern['duration']))
+    return _cached(key, lambda: apply_plot_theme(
+        px.bar(weekly_pattern, x='weekday', y='duration',
+               title='Average Sleep Duration by Day',
+               labels={'duration': 'Hours', 'weekday': 'Day of Week'}),
+        height=400))
+
+
+def duration_histogram(df, nbins=20):
+    # Binned here so the browser receives nbins bars, not every night
+    counts, edges = np.histogram(df['duration'].to_numpy(), bins=nbins)
+    key = ("histogram", fingerprint(counts, edges))
+
+    def build():
+        fig = px.bar(x=(edges[:-1] + edges[1:]) / 2, y=counts,
+                     title='Sleep Duration Distribution',
+                     labels={'x': 'Hours', 'y': 'count'})
+        fig.update_traces(width=edges[1] - edges[0] if len(edges) > 1 else None)
+        return apply_plot_theme(fig, height=400)
+
+    return _cached(key, build)
+
+
+def quality_bar(quality_dist):
+    key = ("quality", fingerprint(quality_dist['quality'], quality_dist['percentage']))
+    return _cached(key, lambda: apply_plot_theme(
+        px.bar(quality_dist, x='quality', y='percentage',
+               title='Sleep Quality Distribution',
+               labels={'quality': 'Quality Rating', 'percentage': 'Percentage'}),
+        height=400))
+
+
+def sleep_heatmap(heatmap):
+    """Weekday x time-of-day occupancy from ``metrics.create_sleep_heatmap``."""
+    key = ("heatmap", fingerprint(heatmap.to_numpy(), heatmap.columns.to_numpy()))
+    return _cached(key, lambda: apply_plot_theme(
+        px.imshow(heatmap * 100, aspect='auto', color_continuous_scale='Plasma',
+                  labels={'x': 'Time of Day', 'y': 'Day of Week', 'color': '% asleep'},
+                  title='When You Sleep'),
+        height=400))
+
+
+def quality_scatter(df):
+    rated = df[df['sleep_quality'] != records.UNRATED]
+    duration = rated['duration'].to_numpy()
+    quality = rated['sleep_quality'].to_numpy()
+    if len(duration) > MAX_POINTS * 10:
+        # Past this size extra points only overdraw; keep an even stride
+        step = len(duration) // (MAX_POINTS * 10) + 1
+        duration, quality = duration[::step], quality[::step]
+    render_mode = 'webgl' if len(duration) > WEBGL_THRESHOLD else 'svg'
+    key = ("scatter", render_mode, fingerprint(duration, quality))
+    return _cached(key, lambda: apply_plot_theme(
+        px.scatter(x=duration, y=quality, render_mode=render_mode,
+                   title='Sleep Quality vs Duration',
+                   labels={'x': 'Hours', 'y': 'Quality'}),
+        height=400))
+
+
+def percentile_bars(labels, percentiles):
+    """Where the user's averages rank among all users, 0-100."""
+    percentiles = np.asarray(percentiles, dtype=np.float64)
+    key = ("percentiles", fingerprint(np.asarray(labels, dtype=object), percentiles))
+
+    def build():
+        fig = px.bar(x=percentiles, y=labels, orientation='h', range_x=[0, 100],
+                     title='Your Percentile Among All Users',
+                     labels={'x': 'Percentile', 'y': ''})
+        fig.add_vline(x=50, line_dash='dot', line_color='rgba(255,255,255,0.4)')
+        return apply_plot_theme(fig, height=300)
+
+    return _cached(key, build)
@@ -0,0 +1,327 @@
+"""Where a user's averages fall among all users.
+
+Each user's all-time sums live in ``cohort_member`` and every metric's
+distribution of per-user averages in a t-digest (``sleep_monitor.sketch``)
+stored in ``cohort_sketch``.  The digests are built by streaming grouped
+sums out of sleep_log one user-id range at a time.  Afterwards every insert
+updates its users' sums and appends the change to ``cohort_delta``: the old
+average with weight -1, the new one with weight +1.  Each server process
+keeps the digests in memory and folds in the deltas it has not seen yet, so a
+percentile is two lookups in a fixed-size digest however many users exist.
+
+A rebuild folds the accumulated deltas back into the digests and deletes
+them, which is what keeps ``cohort_delta`` bounded.  The nightly
+``python -m sleep_monitor.batch`` run rebuilds after refreshing the user
+metrics; to rebuild on its own (say after a bulk import) run
+
+    python -m sleep_monitor.cohort
+"""
+import argparse
+import sys
+import threading
+
+import numpy as np
+
+from sleep_monitor import db, migrations, profiling, records, retention, rollups, write_queue
+from sleep_monitor.cache import user_cache
+from sleep_monitor.sketch import TDigest
+
+METRICS = ("duration", "quality", "bedtime")
+
+USERS_PER_CHUNK = 5000
+
+MEMBER_COLUMNS = ['user_id', 'nights', 'duration_sum', 'rated', 'quality_sum', 'bedtime_sum']
+
+_lock = threading.Lock()
+_state = None
+
+
+def create_tables(cursor, backend):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS cohort_member (
+            user_id INT PRIMARY KEY,
+            nights INT NOT NULL DEFAULT 0,
+            duration_sum DOUBLE NOT NULL DEFAULT 0,
+            rated INT NOT NULL DEFAULT 0,
+            quality_sum DOUBLE NOT NULL DEFAULT 0,
+            bedtime_sum DOUBLE NOT NULL DEFAULT 0,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS cohort_sketch (
+            metric VARCHAR(20) PRIMARY KEY,
+            users INT NOT NULL,
+            delta_id INT NOT NULL,
+            digest TEXT NOT NULL,
+            built_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS cohort_delta (
+            id {backend.autoincrement_pk},
+            metric VARCHAR(20) NOT NULL,
+            value DOUBLE NOT NULL,
+            weight INT NOT NULL
+        )
+    """)
+
+
+def bedtime_hours(sleep_sec):
+    """Bedtime as hours after noon, so 23:00 and 01:00 average to midnight."""
+    return ((sleep_sec - 43200) % 86400) / 3600.0
+
+
+def averages(nights, duration_sum, rated, quality_sum, bedtime_sum):
+    """``{metric: average}`` from a member's sums; quality only once a night is rated."""
+    if not nights:
+        return {}
+    values = {"duration": duration_sum / nights, "bedtime": bedtime_sum / nights}
+    if rated:
+        values["quality"] = quality_sum / rated
+    return values
+
+
+# Build
+def _sums_query(backend, archive):
+    columns = f"user_id, duration_hours, sleep_quality, {backend.time_to_sec('sleep_time')} AS sleep_sec"
+    source, copies = retention.tiers(columns, "user_id BETWEEN %s AND %s", archive)
+    return db.sql(f"""
+        SELECT
+            user_id,
+            COUNT(*),
+            SUM(duration_hours),
+            COUNT(sleep_quality),
+            COALESCE(SUM(sleep_quality), 0),
+            SUM(CASE WHEN sleep_sec < 43200 THEN sleep_sec + 43200 ELSE sleep_sec - 43200 END) / 3600.0
+        FROM {source}
+        GROUP BY user_id
+    """), copies
+
+
+def build(cursor, users_per_chunk=USERS_PER_CHUNK, archive=True):
+    """Recompute every member's sums and the digests from sleep_log.
+
+    Deletes the deltas this folds in.  Migration 8 passes ``archive=False``.
+    """
+    backend = db.get_backend()
+    # Read in the same snapshot as the sums, so exactly these deltas are folded in; a
+    # transaction committing later may hold a lower id and must survive the delete
+    cursor.execute("SELECT id FROM cohort_delta")
+    folded = [row[0] for row in cursor.fetchall()]
+    delta_id = max(folded, default=0)
+    cursor.execute("SELECT MIN(id), MAX(id) FROM users")
+    first, last = cursor.fetchone()
+    digests = {metric: TDigest() for metric in METRICS}
+    query, copies = _sums_query(backend, archive)
+    upsert = db.sql(backend.upsert("cohort_member", MEMBER_COLUMNS, ["user_id"]))
+    users = 0
+    # One id range at a time keeps memory bounded; per-range digests merge exactly
+    for start in range(first or 0, (last or -1) + 1, users_per_chunk):
+        cursor.execute(query, (start, start + users_per_chunk - 1) * copies)
+        rows = cursor.fetchall()
+        if not rows:
+            continue
+        cursor.executemany(upsert, rows)
+        sums = np.array([row[1:] for row in rows], dtype=np.float64)
+        nights, rated = sums[:, 0], sums[:, 2]
+        chunk = {
+            "duration": sums[:, 1] / nights,
+            "quality": sums[rated > 0, 3] / rated[rated > 0],
+            "bedtime": sums[:, 4] / nights,
+        }
+        for metric in METRICS:
+            digests[metric].merge(_digest(chunk[metric]))
+        users += len(rows)
+    cursor.executemany(
+        db.sql(backend.upsert("cohort_sketch", ["metric", "users", "delta_id", "digest"], ["metric"])),
+        [(metric, users, delta_id, digests[metric].to_json()) for metric in METRICS],
+    )
+    cursor.executemany(db.sql("DELETE FROM cohort_delta WHERE id = %s"), [(id_,) for id_ in folded])
+    return users
+
+
+def _digest(values):
+    digest = TDigest()
+    digest.update(values)
+    return digest
+
+
+# Incremental updates
+def add(cursor, rows):
+    """Move each user's sums by their new nights and log the digest deltas.
+
+    Member rows stay write-locked until the caller commits.
+    """
+    if not rows:
+        return
+    changes = {}
+    for user_id, _, sleep_time, wake_time, quality, _ in rows:
+        sleep_sec, wake_sec = rollups.as_seconds(sleep_time), rollups.as_seconds(wake_time)
+        change = changes.setdefault(user_id, [0, 0.0, 0, 0.0, 0.0])
+        change[0] += 1
+        change[1] += ((wake_sec - sleep_sec) % 86400) / 3600.0
+        change[2] += 1 if quality else 0
+        change[3] += quality or 0
+        change[4] += bedtime_hours(sleep_sec)
+    backend = db.get_backend()
+    user_ids = list(changes)
+    upsert = db.sql(backend.upsert("cohort_member", MEMBER_COLUMNS, ["user_id"], increment=True))
+    # Adding zero first write-locks every member row (creating missing ones) until
+    # commit, so a concurrent add cannot read the same "before" sums.  Unlike
+    # SELECT ... FOR UPDATE this works on both backends and takes no gap locks.
+    cursor.executemany(upsert, [(user_id, 0, 0.0, 0, 0.0, 0.0) for user_id in user_ids])
+    cursor.execute(
+        db.sql(f"SELECT {', '.join(MEMBER_COLUMNS)} FROM cohort_member "
+               f"WHERE user_id IN ({', '.join(['%s'] * len(user_ids))})"),
+        user_ids,
+    )
+    before = {row[0]: list(row[1:]) for row in cursor.fetchall()}
+    cursor.executemany(upsert, [(user_id, *change) for user_id, change in changes.items()])
+    deltas = []
+    for user_id, change in changes.items():
+        old = before.get(user_id, [0, 0.0, 0, 0.0, 0.0])
+        deltas += [(metric, value, -1) for metric, value in averages(*old).items()]
+        deltas += [(metric, value, 1)
+                   for metric, value in averages(*(a + b for a, b in zip(old, change))).items()]
+    cursor.executemany(db.sql("INSERT INTO cohort_delta (metric, value, weight) VALUES (%s, %s, %s)"),
+                       deltas)
+
+
+# Lookups
+class Population:
+    """The stored digests plus the deltas appended since, for one metric each."""
+
+    def __init__(self, delta_id, sketches):
+        self.delta_id = delta_id
+        # Every delta still stored is one the digests lack, whatever its id
+        self.watermark = 0
+        self.base = sketches
+        self.added = {metric: TDigest() for metric in METRICS}
+        self.removed = {metric: TDigest() for metric in METRICS}
+
+    def apply(self, deltas):
+        """Fold in ``(id, metric, value, weight)`` rows in id order, skipping any already seen."""
+        for delta_id, metric, value, weight in deltas:
+            if delta_id <= self.watermark:
+                continue
+            target = self.added if weight > 0 else self.removed
+            if metric in target:
+                target[metric].update([value], [abs(weight)])
+            self.watermark = max(self.watermark, delta_id)
+
+    def _parts(self, metric):
+        return [(digest, sign) for digest, sign in ((self.base.get(metric), 1), (self.added[metric], 1),
+                                                    (self.removed[metric], -1)) if digest is not None]
+
+    def users(self, metric):
+        return sum(sign * digest.count for digest, sign in self._parts(metric))
+
+    def percentile(self, metric, value):
+        """Share of users whose average is below ``value``, 0-100."""
+        total = self.users(metric)
+        if total <= 0:
+            return np.nan
+        below = sum(sign * digest.rank(value) for digest, sign in self._parts(metric))
+        return float(np.clip(below / total * 100, 0, 100))
+
+    def quantile(self, metric, q):
+        """Average at percentile ``q`` (0-1), found by bisecting the combined rank."""
+        parts = [digest for digest, _ in self._parts(metric) if digest.count]
+        if not parts or self.users(metric) <= 0:
+            return np.nan
+        lo, hi = min(digest.min for digest in parts), max(digest.max for digest in parts)
+        for _ in range(40):
+            mid = (lo + hi) / 2
+            if self.percentile(metric, mid) < q * 100:
+                lo = mid
+            else:
+                hi = mid
+        return (lo + hi) / 2
+
+
+def population():
+    """This process's view of every user, brought up to date with new deltas.
+
+    The queries run without the lock; it is held only to install a reloaded
+    view or fold the new deltas into the current one.
+    """
+    global _state
+    state = _state
+    with db.cursor() as cursor:
+        cursor.execute("SELECT COALESCE(MAX(delta_id), 0) FROM cohort_sketch")
+        delta_id = cursor.fetchone()[0]
+        if state is None or state.delta_id != delta_id:
+            # First use, or rebuilt by another process: the deltas we folded may be gone
+            cursor.execute("SELECT metric, digest FROM cohort_sketch")
+            state = Population(delta_id, {metric: TDigest.from_json(digest)
+                                          for metric, digest in cursor.fetchall()})
+        since = state.watermark
+        cursor.execute(db.sql("SELECT id, metric, value, weight FROM cohort_delta WHERE id > %s ORDER BY id"),
+                       (since,))
+        deltas = cursor.fetchall()
+    with _lock:
+        if _state is None or _state.delta_id != state.delta_id:
+            _state = state
+        # Another thread may have moved on meanwhile; our rows still cover everything after ``since``
+        if _state.watermark >= since:
+            _state.apply(deltas)
+        return _state
+
+
+def standing(user_id):
+    """``{metric: (average, percentile)}`` for the user; empty before their first night.
+
+    Cached per data version and per population state, so other users' saves
+    move the percentiles too.
+    """
+    people = population()
+    marker = (people.delta_id, people.watermark)
+    cached = user_cache.get(user_id, "cohort")
+    entry = cached[1] if cached is not None and cached[0] == marker else None
+    if entry is None:
+        version = user_cache.version(user_id)
+        with profiling.span("cohort.standing"):
+            with db.cursor() as cursor:
+                cursor.execute(db.sql(f"SELECT {', '.join(MEMBER_COLUMNS[1:])} FROM cohort_member "
+                                      "WHERE user_id = %s"), (user_id,))
+                row = cursor.fetchone()
+            sums = list(row) if row else [0, 0.0, 0, 0.0, 0.0]
+            if write_queue.enabled():
+                sums = [a + b for a, b in zip(sums, _pending_sums(user_id))]
+            values = averages(*sums)
+            entry = {metric: (value, people.percentile(metric, value)) for metric, value in values.items()}
+        user_cache.put(user_id, "cohort", (marker, entry), version=version)
+    return entry
+
+
+def _pending_sums(user_id):
+    # Queued submissions count towards the user's own averages before they are flushed
+    pending = write_queue.pending_frame(user_id)
+    quality = pending['sleep_quality'].to_numpy()
+    rated = quality != records.UNRATED
+    return [len(pending), float(pending['duration'].sum()), int(rated.sum()),
+            float(quality[rated].sum()), float(bedtime_hours(pending['sleep_sec'].to_numpy()).sum())]
+
+
+def reset():
+    """Forget the in-memory digests; the next lookup reloads them."""
+    global _state
+    with _lock:
+        _state = None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild the cohort percentile sketches from sleep_log.")
+    parser.add_argument("--users-per-chunk", type=int, default=USERS_PER_CHUNK)
+    args = parser.parse_args(argv)
+
+    migrations.ensure_schema()
+    with db.cursor(commit=True) as cursor:
+        users = build(cursor, args.users_per_chunk)
+    print(f"{users} users", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,406 @@
+"""The logged-in dashboard page.
+
+Kept out of ``sleep_dashboard.py`` so the login and signup pages never
+import pandas, numpy or plotly: this module is first imported when a user
+reaches the dashboard.
+"""
+import io
+import math
+import os
+from datetime import datetime, date, timedelta
+
+import streamlit as st
+
+from sleep_monitor import charts, cohort, db, exporter, loader, notes, profiling, rolling, write_queue
+from sleep_monitor.cache import user_cache
+from sleep_monitor.importer import import_file
+from sleep_monitor.loader import date_bounds, load_summary, load_window
+from sleep_monitor.metrics import TARGET_HOURS, create_sleep_heatmap, window_metrics
+from sleep_monitor.validation import validate_entry
+from sleep_monitor.writes import insert_nights
+
+DEFAULT_WINDOW_DAYS = 90
+
+# Save sleep entry
+def save_sleep_data(user_id, log_date, sleep_time, wake_time, sleep_quality, notes):
+    if write_queue.enabled():
+        write_queue.enqueue(user_id, log_date, sleep_time, wake_time, sleep_quality, notes)
+        return
+    row = (user_id, log_date, sleep_time, wake_time, sleep_quality, notes)
+    with profiling.span("db.save"), db.cursor(commit=True) as cursor:
+        insert_nights(cursor, [row])
+    user_cache.bump(user_id)
+
+# Run a block as an independently rerunnable fragment where Streamlit supports it
+fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None) or (lambda func: func)
+
+def profiling_active():
+    return profiling.ENABLED or st.session_state.get("show_profile", False)
+
+def show_chart(fig, name):
+    # Plotly serializes the figure inside st.plotly_chart
+    with profiling.span(f"render.{name}"):
+        st.plotly_chart(fig, use_container_width=True, config=charts.CHART_CONFIG)
+
+ANALYSIS_SECTIONS = ["Detailed Metrics", "Trends", "Weekly Patterns", "Sleep Heatmap", "Distributions", "Quality Analysis", "Notes", "Population"]
+
+def sleep_log_form(user_id):
+    # A form only reruns the script on submit, not on every keystroke
+    with st.form("sleep_log_form"):
+        st.markdown("### Log Today's Sleep")
+        today = date.today()
+        
+        # Set default times
+        default_sleep_time = datetime.strptime("22:00", "%H:%M").time()
+        default_wake_time = datetime.strptime("06:00", "%H:%M").time()
+        
+        time_col1, time_col2 = st.columns(2)
+        with time_col1:
+            sleep_time = st.time_input("Sleep Time", value=default_sleep_time)
+        with time_col2:
+            wake_time = st.time_input("Wake Time", value=default_wake_time)
+        
+        sleep_quality = st.slider("Sleep Quality (1-5)", 1, 5, 3)
+        notes = st.text_area("Notes (optional)")
+        
+        if st.form_submit_button("Submit Sleep Log"):
+            duration, error = validate_entry(sleep_time, wake_time, sleep_quality)
+            
+            if error:
+                st.error(error)
+            else:
+                # The sections below read the data afterwards in this same run
+                save_sleep_data(user_id, today, sleep_time, wake_time, sleep_quality, notes)
+                st.success(f"Sleep data saved successfully! Duration: {duration:.1f} hours")
+
+def import_history(user_id):
+    with st.expander("Import sleep history (CSV / JSON)"):
+        uploaded = st.file_uploader("Export file", type=["csv", "json", "jsonl"])
+        if uploaded is not None and st.button("Import"):
+            fmt = "csv" if uploaded.name.lower().endswith(".csv") else "json"
+            progress = st.progress(0.0, text="Importing...")
+            
+            def report(result):
+                # Bytes consumed so far is a good enough progress measure
+                progress.progress(min(uploaded.tell() / max(uploaded.size, 1), 1.0),
+                                  text=f"{result.imported} rows imported")
+            
+            stream = io.TextIOWrapper(uploaded, encoding="utf-8", newline="")
+            try:
+                result = import_file(user_id, stream, fmt, progress=report)
+            except Exception as exc:
+                st.error(f"Import failed: {exc}")
+                return
+            progress.progress(1.0, text=f"{result.imported} rows imported")
+            if result.error:
+                st.error(result.error)
+            if result.rejected:
+                st.warning(f"{result.rejected} rows were rejected:\n\n" + "\n\n".join(result.errors))
+            elif not result.error:
+                st.success(f"Imported {result.imported} nights.")
+
+def quick_stats(user_id):
+    summary = load_summary(user_id)
+    
+    st.markdown("### Quick Stats")
+    st.metric("Average Sleep Duration", f"{summary['avg_duration']:.1f} hours")
+    st.metric("Average Sleep Quality", f"{summary['avg_quality']:.1f}/5")
+    st.metric("Sleep Efficiency", f"{summary['efficiency']:.1f}%")
+    
+    # Sleep Quality Distribution
+    fig_quality = charts.quality_pie(summary['quality_counts'])
+    show_chart(fig_quality, "quality_pie")
+
+def detailed_metrics_section(metrics):
+    st.markdown("### Detailed Sleep Metrics")
+    metric_col1, metric_col2, metric_col3 = st.columns(3)
+    
+    with metric_col1:
+        st.metric("Sleep Duration Consistency", 
+                 f"{metrics['duration_std']:.1f} hours std",
+                 delta=f"{metrics['avg_duration']:.1f} hours avg")
+    
+    with metric_col2:
+        st.metric("Sleep Quality Consistency", 
+                 f"{metrics['quality_std']:.1f} std",
+                 delta=f"{metrics['avg_quality']:.1f} avg")
+    
+    with metric_col3:
+        st.metric("Sleep Time Consistency", 
+                 f"{metrics['sleep_time_std']:.1f} hours std")
+
+def trends_section(filtered_df, trends):
+    # Rolling figures as of the last logged day in the range
+    if not trends.empty:
+        latest = trends.iloc[-1]
+        roll_col1, roll_col2, roll_col3 = st.columns(3)
+        with roll_col1:
+            st.metric("7-Day Average", f"{latest['avg_7']:.1f} hours",
+                      delta=f"{latest['std_7']:.1f} hours std", delta_color="off")
+        with roll_col2:
+            st.metric("30-Day Average", f"{latest['avg_30']:.1f} hours",
+                      delta=f"{latest['std_30']:.1f} hours std", delta_color="off")
+        with roll_col3:
+            st.metric("Sleep Debt", f"{latest['debt']:.1f} hours",
+                      help=f"Cumulative shortfall against {TARGET_HOURS:.0f} hours a night")
+    
+    # Create two columns for charts
+    chart_col1, chart_col2 = st.columns(2)
+    
+    with chart_col1:
+        # Sleep Duration Trend
+        fig_duration = charts.duration_trend(filtered_df, trends)
+        show_chart(fig_duration, "duration_trend")
+    
+    with chart_col2:
+        # Sleep Quality Trend
+        fig_quality = charts.trend_line(filtered_df, 'sleep_quality', 'Sleep Quality Trend', 'Quality (1-5)')
+        show_chart(fig_quality, "quality_trend")
+    
+    # Cumulative Sleep Debt
+    if not trends.empty:
+        fig_debt = charts.trend_line(trends, 'debt', 'Cumulative Sleep Debt', 'Hours')
+        show_chart(fig_debt, "sleep_debt")
+
+def weekly_section(metrics):
+    st.markdown("### Weekly Sleep Patterns")
+    fig_weekly = charts.weekly_bar(metrics['weekly_pattern'])
+    show_chart(fig_weekly, "weekly_bar")
+
+def heatmap_section(filtered_df):
+    st.markdown("### Sleep Heatmap")
+    with profiling.span("metrics.heatmap", rows=len(filtered_df)):
+        heatmap = create_sleep_heatmap(filtered_df)
+    fig_heatmap = charts.sleep_heatmap(heatmap)
+    show_chart(fig_heatmap, "sleep_heatmap")
+
+def distribution_section(filtered_df):
+    st.markdown("### Sleep Patterns")
+    fig_dist = charts.duration_histogram(filtered_df)
+    show_chart(fig_dist, "duration_histogram")
+
+def quality_section(filtered_df, metrics):
+    st.markdown("### Sleep Quality Analysis")
+    quality_col1, quality_col2 = st.columns(2)
+    
+    with quality_col1:
+        # Quality Distribution
+        fig_quality_dist = charts.quality_bar(metrics['quality_dist'])
+        show_chart(fig_quality_dist, "quality_bar")
+    
+    with quality_col2:
+        # Quality vs Duration
+        fig_quality_duration = charts.quality_scatter(filtered_df)
+        show_chart(fig_quality_duration, "quality_scatter")
+
+def notes_section(user_id, start, end):
+    st.markdown("### Sleep Notes")
+    query = st.text_input("Search notes", key="notes_query", placeholder="e.g. coffee")
+    
+    # Keyset cursors of the pages visited so far; a new search starts over
+    scope = (query, start, end)
+    if st.session_state.get("notes_scope") != scope:
+        st.session_state["notes_scope"] = scope
+        st.session_state["notes_cursors"] = [None]
+    cursors = st.session_state["notes_cursors"]
+    page = notes.search_notes(user_id, query, start, end, after=cursors[-1])
+    
+    if not page.rows:
+        st.info("No notes match your search." if query else "No notes in this date range.")
+    for _, log_date, text in page.rows:
+        st.markdown(f"""
+            <div class="card">
+                <strong>{str(log_date)[:10]}</strong><br>
+                {notes.highlight(text, query)}
+            </div>
+        """, unsafe_allow_html=True)
+    
+    newer_col, page_col, older_col = st.columns([1, 2, 1])
+    with newer_col:
+        st.button("Newer", on_click=cursors.pop, disabled=len(cursors) == 1)
+    with page_col:
+        st.caption(f"Page {len(cursors)}")
+    with older_col:
+        st.button("Older", on_click=cursors.append, args=(page.next_cursor,),
+                  disabled=page.next_cursor is None)
+
+def _clock(hours_after_noon):
+    minutes = int(round(hours_after_noon * 60)) % (24 * 60)
+    return f"{(minutes // 60 + 12) % 24:02d}:{minutes % 60:02d}"
+
+def population_section(user_id):
+    st.markdown("### Compared to Everyone")
+    st.caption("All-time averages against every user's, regardless of the selected dates.")
+    standing = cohort.standing(user_id)
+    if not standing:
+        st.info("Your nights are not in the population figures yet.")
+        return
+    people = cohort.population()
+    
+    rows = [("duration", "Average Duration", "longer", lambda value: f"{value:.1f} hours"),
+            ("quality", "Average Quality", "better", lambda value: f"{value:.1f}/5"),
+            ("bedtime", "Average Bedtime", "later", _clock)]
+    # Nights still in the write-behind queue have a value but no population to rank against
+    rows = [row for row in rows if row[0] in standing and not math.isnan(standing[row[0]][1])]
+    if not rows:
+        st.info("Your nights are not in the population figures yet.")
+        return
+    columns = st.columns(len(rows))
+    for column, (metric, label, comparison, fmt) in zip(columns, rows):
+        value, percentile = standing[metric]
+        with column:
+            st.metric(label, fmt(value), delta=f"{comparison} than {percentile:.0f}% of users",
+                      delta_color="off", help=f"Median user: {fmt(people.quantile(metric, 0.5))}")
+    
+    fig_percentiles = charts.percentile_bars([row[1] for row in rows],
+                                             [standing[row[0]][1] for row in rows])
+    show_chart(fig_percentiles, "percentile_bars")
+
+@fragment
+def sleep_analysis(user_id, bounds):
+    # Fragment reruns skip the main script, so they trace themselves
+    with profiling.trace(profiling_active()) as spans:
+        analysis_view(user_id, bounds)
+    if spans is not None:
+        st.session_state["profile_spans"] = spans
+
+def analysis_view(user_id, bounds):
+    st.markdown("### Sleep Analysis")
+    first_date, last_date, _ = bounds
+    
+    # Date Range Filter (defaults to the most recent window only)
+    date_range = st.date_input(
+        "Select Date Range",
+        value=(max(first_date, last_date - timedelta(days=DEFAULT_WINDOW_DAYS - 1)), last_date),
+        min_value=first_date,
+        max_value=last_date
+    )
+    
+    # Only the visible section loads and computes anything
+    section = st.radio("Section", ANALYSIS_SECTIONS, horizontal=True,
+                       key="analysis_section", label_visibility="collapsed")
+    
+    if len(date_range) == 2:
+        start, end = date_range
+        
+        # Metrics come from rollup rows; raw nights are loaded only for charts that plot them
+        with profiling.span("section." + section.lower().replace(" ", "_")):
+            if section == "Detailed Metrics":
+                detailed_metrics_section(window_metrics(user_id, start, end))
+            elif section == "Trends":
+                trends_section(load_window(user_id, start, end),
+                               rolling.window(rolling.load_trends(user_id), start, end))
+            elif section == "Weekly Patterns":
+                weekly_section(window_metrics(user_id, start, end))
+            elif section == "Sleep Heatmap":
+                heatmap_section(load_window(user_id, start, end))
+            elif section == "Distributions":
+                distribution_section(load_window(user_id, start, end))
+            elif section == "Quality Analysis":
+                quality_section(load_window(user_id, start, end), window_metrics(user_id, start, end))
+            elif section == "Notes":
+                notes_section(user_id, start, end)
+            elif section == "Population":
+                population_section(user_id)
+
+def forget_export():
+    # Once downloaded the file is not needed, and keeping the button would re-read it every rerun
+    export_path = st.session_state.pop("export_path", None)
+    if export_path and os.path.exists(export_path):
+        os.remove(export_path)
+
+def dashboard():
+    st.title("🌙 Sleep Monitor Dashboard")
+    user_id = st.session_state['user_id']
+    
+    # Create two columns for the main layout
+    col1, col2 = st.columns([2, 1])
+    
+    with col1:
+        # Sleep Entry Form
+        sleep_log_form(user_id)
+        import_history(user_id)
+    
+    # Loaded after the form so a submission in this run is already visible
+    bounds = date_bounds(user_id)
+    
+    with col2:
+        # Quick Stats
+        if bounds:
+            quick_stats(user_id)
+    
+    # Main Content Area
+    if bounds:
+        sleep_analysis(user_id, bounds)
+    
+    # Export
+    with st.sidebar.expander("Export data"):
+        formats = ["CSV", "Parquet"] if exporter.parquet_available() else ["CSV"]
+        export_format = st.radio("Format", formats, horizontal=True, key="export_format")
+        if st.button("Prepare export"):
+            # Streamed to disk in chunks; only the finished file is handed to the browser
+            suffix = ".csv" if export_format == "CSV" else ".parquet"
+            with exporter.export_file(suffix) as tmp:
+                if export_format == "CSV":
+                    with io.TextIOWrapper(tmp, encoding="utf-8", newline="") as stream:
+                        exporter.write_csv(user_id, stream)
+                else:
+                    exporter.write_parquet(user_id, tmp)
+            previous = st.session_state.get("export_path")
+            if previous and os.path.exists(previous):
+                os.remove(previous)
+            st.session_state["export_path"] = tmp.name
+        export_path = st.session_state.get("export_path")
+        if export_path and os.path.exists(export_path):
+            with open(export_path, "rb") as export_file:
+                st.download_button("Download", export_file, on_click=forget_export,
+                                   file_name=f"sleep_log{os.path.splitext(export_path)[1]}")
+    
+    # Cache effectiveness
+    with st.sidebar.expander("Data cache"):
+        cache_stats = user_cache.stats()
+        st.caption(f"{cache_stats['hits']} hits / {cache_stats['misses']} misses "
+                   f"({cache_stats['hit_rate']:.0%} hit rate)")
+        st.caption(f"{cache_stats['entries']} entries, {cache_stats['bytes'] / 1024:.0f} KiB, "
+                   f"{cache_stats['evictions']} evictions")
+        st.caption(f"Loads: {loader.stats['full']} full, {loader.stats['delta']} delta, "
+                   f"{loader.stats['resync']} resync")
+        st.caption(f"Figures: {charts.stats['hits']} cached / {charts.stats['misses']} built")
+        if write_queue.enabled():
+            st.caption(f"Write-behind: {write_queue.stats['enqueued']} queued, "
+                       f"{write_queue.stats['flushed']} flushed in {write_queue.stats['batches']} batches, "
+                       f"{write_queue.stats['failures']} failures")
+    
+    # Logout button in sidebar
+    if st.sidebar.button("Logout"):
+        forget_export()
+        st.session_state.clear()
+        st.rerun()
+
+def performance_panel(spans):
+    if not st.sidebar.checkbox("Performance panel", key="show_profile"):
+        return
+    with st.sidebar.expander("Performance", expanded=True):
+        if spans:
+            rows = profiling.span_rows(spans)
+            st.caption(f"Last run: {sum(row['duration_ms'] for row in rows if row['depth'] == 0):.0f} ms "
+                       f"in {len(rows)} spans")
+            st.dataframe(
+                [{"span": "· " * row['depth'] + row['name'], "ms": round(row['duration_ms'], 1),
+                  "rows": row.get('rows')} for row in rows],
+                hide_index=True, use_container_width=True,
+            )
+        else:
+            st.caption("Timings appear from the next rerun.")
+        st.download_button("Spans (JSON)", profiling.to_json(spans),
+                           file_name="sleep_profile.json", mime="application/json")
+        st.download_button("Metrics (Prometheus)", profiling.prometheus_text(),
+                           file_name="sleep_metrics.prom", mime="text/plain")
+
+# Page entry point, traced as one rerun when profiling is on
+def render():
+    with profiling.trace(profiling_active()) as spans:
+        dashboard()
+    if spans is not None:
+        st.session_state["profile_spans"] = spans
+    performance_panel(st.session_state.get("profile_spans"))
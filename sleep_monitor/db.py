@@ -0,0 +1,352 @@
+"""Database backends and a shared connection pool.
+
+Every query in the app checks a connection out of one process-wide pool
+instead of opening a new one, so a dashboard rerun pays the TCP + auth
+handshake at most once per pooled connection.  The backend is chosen with
+``SLEEP_DB_BACKEND`` (``mysql`` by default, ``sqlite`` for local runs and
+load tests).
+"""
+import os
+import queue
+import sqlite3
+import threading
+import time as _time
+import uuid
+from contextlib import contextmanager
+from datetime import date, datetime, time
+
+from sleep_monitor import profiling
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection becomes free in time."""
+
+
+# MySQL backend
+class MySQLBackend:
+    name = "mysql"
+    autoincrement_pk = "INT AUTO_INCREMENT PRIMARY KEY"
+
+    def __init__(self, host, user, password, database, port=3306):
+        self.params = dict(host=host, user=user, password=password,
+                           database=database, port=port)
+
+    @property
+    def IntegrityError(self):
+        import mysql.connector
+        return mysql.connector.errors.IntegrityError
+
+    def connect(self):
+        import mysql.connector
+        return mysql.connector.connect(**self.params)
+
+    def ping(self, conn):
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def sql(self, query):
+        return query
+
+    def time_text(self, column):
+        return f"CAST({column} AS CHAR)"
+
+    def time_to_sec(self, column):
+        return f"TIME_TO_SEC({column})"
+
+    def column_exists(self, cursor, table, column):
+        cursor.execute(f"SHOW COLUMNS FROM {table} LIKE %s", (column,))
+        return cursor.fetchone() is not None
+
+    def index_exists(self, cursor, table, index):
+        cursor.execute(f"SHOW INDEX FROM {table} WHERE Key_name = %s", (index,))
+        return bool(cursor.fetchall())
+
+    def generated_column(self, name, sql_type, expression):
+        return f"{name} {sql_type} AS ({expression}) STORED"
+
+    def explain(self, query):
+        return f"EXPLAIN {query}"
+
+    def create_notes_index(self, cursor, table="sleep_log"):
+        if not self.index_exists(cursor, table, f"ft_{table}_notes"):
+            cursor.execute(f"ALTER TABLE {table} ADD FULLTEXT INDEX ft_{table}_notes (notes)")
+
+    def notes_match(self, table="sleep_log"):
+        # The FULLTEXT index is found from the column; every indexed table matches the same way
+        return "MATCH(notes) AGAINST (%s IN BOOLEAN MODE)"
+
+    def notes_query(self, words):
+        # Every word required, each as a prefix
+        return " ".join(f"+{word}*" for word in words)
+
+    def upsert(self, table, columns, keys, increment=False):
+        updates = ", ".join(f"{col} = {col + ' + ' if increment else ''}VALUES({col})"
+                            for col in columns if col not in keys)
+        return (f"INSERT INTO {table} ({', '.join(columns)}) "
+                f"VALUES ({', '.join(['%s'] * len(columns))}) ON DUPLICATE KEY UPDATE {updates}")
+
+    def streaming_cursor(self, conn):
+        # Unbuffered: rows stay on the server until fetched
+        return conn.cursor(buffered=False)
+
+
+# SQLite backend (local development and load testing)
+class SQLiteBackend:
+    name = "sqlite"
+    autoincrement_pk = "INTEGER PRIMARY KEY AUTOINCREMENT"
+    IntegrityError = sqlite3.IntegrityError
+
+    def __init__(self, path="sleep_dashboard.db"):
+        if path == ":memory:":
+            # Pooled connections must all see the same in-memory database
+            path = f"file:sleep-{uuid.uuid4().hex}?mode=memory&cache=shared"
+        self.path = path
+        self._uri = path.startswith("file:")
+
+    def connect(self):
+        conn = sqlite3.connect(self.path, uri=self._uri, timeout=30,
+                               check_same_thread=False)
+        conn.execute("PRAGMA foreign_keys = ON")
+        if not self._uri:
+            conn.execute("PRAGMA journal_mode = WAL")
+        return conn
+
+    def ping(self, conn):
+        try:
+            conn.execute("SELECT 1")
+            return True
+        except sqlite3.Error:
+            return False
+
+    def sql(self, query):
+        return query.replace("%s", "?")
+
+    def time_text(self, column):
+        return column
+
+    def time_to_sec(self, column):
+        # Avoids strftime('%s') so the query survives paramstyle translation
+        return f"CAST(round((julianday({column}) - julianday('00:00:00')) * 86400) AS INTEGER)"
+
+    def column_exists(self, cursor, table, column):
+        cursor.execute(f"PRAGMA table_xinfo({table})")
+        return any(row[1] == column for row in cursor.fetchall())
+
+    def index_exists(self, cursor, table, index):
+        cursor.execute(f"PRAGMA index_list({table})")
+        return any(row[1] == index for row in cursor.fetchall())
+
+    def generated_column(self, name, sql_type, expression):
+        # ALTER TABLE can only add VIRTUAL generated columns in SQLite
+        return f"{name} {sql_type} GENERATED ALWAYS AS ({expression}) VIRTUAL"
+
+    def explain(self, query):
+        return f"EXPLAIN QUERY PLAN {query}"
+
+    def create_notes_index(self, cursor, table="sleep_log"):
+        # External-content FTS5 table kept in step with the table by triggers
+        fts = f"{table}_fts"
+        cursor.execute(f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS {fts}
+            USING fts5(notes, content='{table}', content_rowid='id')
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table} BEGIN
+                INSERT INTO {fts} (rowid, notes) VALUES (new.id, new.notes);
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table} BEGIN
+                INSERT INTO {fts} ({fts}, rowid, notes) VALUES ('delete', old.id, old.notes);
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF notes ON {table} BEGIN
+                INSERT INTO {fts} ({fts}, rowid, notes) VALUES ('delete', old.id, old.notes);
+                INSERT INTO {fts} (rowid, notes) VALUES (new.id, new.notes);
+            END
+        """)
+        cursor.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+
+    def notes_match(self, table="sleep_log"):
+        return f"id IN (SELECT rowid FROM {table}_fts WHERE {table}_fts MATCH %s)"
+
+    def notes_query(self, words):
+        # Quoted so FTS5 syntax characters in notes are never operators
+        return " ".join(f'"{word}"*' for word in words)
+
+    def upsert(self, table, columns, keys, increment=False):
+        updates = ", ".join(f"{col} = {col + ' + ' if increment else ''}excluded.{col}"
+                            for col in columns if col not in keys)
+        return (f"INSERT INTO {table} ({', '.join(columns)}) "
+                f"VALUES ({', '.join(['%s'] * len(columns))}) "
+                f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {updates}")
+
+    def streaming_cursor(self, conn):
+        # SQLite cursors already step through results lazily
+        return conn.cursor()
+
+
+sqlite3.register_adapter(date, lambda d: d.isoformat())
+sqlite3.register_adapter(datetime, lambda d: d.isoformat(" "))
+sqlite3.register_adapter(time, lambda t: t.strftime("%H:%M:%S"))
+
+
+# Connection pool
+class ConnectionPool:
+    """Bounded pool of reusable connections for a single backend.
+
+    Idle connections are health-checked before reuse once they have sat for
+    ``health_check_interval`` seconds, and any connection that was in use when
+    an exception escaped is closed rather than returned to the pool.
+    """
+
+    def __init__(self, backend, size=5, timeout=30.0, health_check_interval=30.0):
+        self.backend = backend
+        self.size = size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._closed = False
+        self.stats = {"created": 0, "reused": 0, "recycled": 0, "failed_checks": 0}
+
+    def _open(self):
+        conn = self.backend.connect()
+        with self._lock:
+            self.stats["created"] += 1
+        return conn
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _checkout(self):
+        while True:
+            try:
+                conn, last_used = self._idle.get_nowait()
+            except queue.Empty:
+                return self._open()
+            idle_for = _time.monotonic() - last_used
+            if idle_for < self.health_check_interval or self.backend.ping(conn):
+                with self._lock:
+                    self.stats["reused"] += 1
+                return conn
+            with self._lock:
+                self.stats["failed_checks"] += 1
+            self._close(conn)
+
+    def _checkin(self, conn):
+        if self._closed:
+            self._close(conn)
+            return
+        if getattr(conn, "in_transaction", False):
+            conn.rollback()
+        self._idle.put((conn, _time.monotonic()))
+
+    def _recycle(self, conn):
+        with self._lock:
+            self.stats["recycled"] += 1
+        self._close(conn)
+
+    @contextmanager
+    def connection(self):
+        """Check a connection out for the duration of the ``with`` block."""
+        with profiling.span("db.pool_wait"):
+            if not self._slots.acquire(timeout=self.timeout):
+                raise PoolTimeout(f"no connection available after {self.timeout}s")
+        try:
+            with profiling.span("db.checkout"):
+                conn = self._checkout()
+            try:
+                yield conn
+            except BaseException:
+                self._recycle(conn)
+                raise
+            else:
+                self._checkin(conn)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._close(conn)
+
+
+def backend_from_env():
+    if os.environ.get("SLEEP_DB_BACKEND", "mysql") == "sqlite":
+        return SQLiteBackend(os.environ.get("SLEEP_DB_PATH", "sleep_dashboard.db"))
+    return MySQLBackend(
+        host=os.environ.get("SLEEP_DB_HOST", "sql8.freesqldatabase.com"),
+        user=os.environ.get("SLEEP_DB_USER", "sql8783645"),
+        password=os.environ.get("SLEEP_DB_PASSWORD", "bXwTUfpwue"),
+        database=os.environ.get("SLEEP_DB_NAME", "sql8783645"),
+        port=int(os.environ.get("SLEEP_DB_PORT", "3306")),
+    )
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def configure(backend=None, size=None, **pool_options):
+    """Replace the process-wide pool, e.g. to point benchmarks at SQLite."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+        _pool = ConnectionPool(
+            backend or backend_from_env(),
+            size=size or int(os.environ.get("SLEEP_DB_POOL_SIZE", "5")),
+            **pool_options,
+        )
+    return _pool
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    backend_from_env(),
+                    size=int(os.environ.get("SLEEP_DB_POOL_SIZE", "5")),
+                )
+    return _pool
+
+
+def get_backend():
+    return get_pool().backend
+
+
+def sql(query):
+    """Translate a ``%s``-style query to the active backend's paramstyle."""
+    return get_backend().sql(query)
+
+
+def connection():
+    return get_pool().connection()
+
+
+@contextmanager
+def cursor(commit=False):
+    """Pooled cursor; commits on clean exit when ``commit`` is set."""
+    with connection() as conn:
+        cur = conn.cursor()
+        try:
+            yield cur
+            if commit:
+                conn.commit()
+        finally:
+            cur.close()
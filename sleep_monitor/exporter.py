@@ -0,0 +1,173 @@
+"""Streaming export of a user's sleep_log to CSV or Parquet.
+
+Rows are read through an unbuffered cursor in fixed-size chunks and written
+out as they arrive, so memory stays flat however long the history is.
+Parquet output needs the optional ``pyarrow`` package.
+
+The dashboard writes exports into a directory private to the server
+process (``export_file()``).  Files older than ``SLEEP_EXPORT_MAX_AGE_SECONDS``
+are removed whenever a new export starts, so a session that closes its tab
+leaves nothing behind for long, and the directory goes when the process exits.
+
+    python -m sleep_monitor.exporter --user-id 1 --format parquet out.parquet
+"""
+import argparse
+import atexit
+import csv
+import functools
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from sleep_monitor import db, retention
+
+CHUNK_SIZE = 5000
+EXPORT_MAX_AGE = float(os.environ.get("SLEEP_EXPORT_MAX_AGE_SECONDS", "3600"))
+
+_lock = threading.Lock()
+_export_dir = None
+
+COLUMNS = ['id', 'date', 'sleep_time', 'wake_time', 'duration_hours',
+           'sleep_quality', 'notes', 'created_at']
+
+
+@functools.lru_cache(maxsize=None)
+def parquet_available():
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _directory():
+    global _export_dir
+    if _export_dir is None:
+        with _lock:
+            if _export_dir is None:
+                path = tempfile.mkdtemp(prefix="sleep-export-")
+                atexit.register(shutil.rmtree, path, ignore_errors=True)
+                _export_dir = path
+    return _export_dir
+
+
+def remove_expired(max_age=EXPORT_MAX_AGE):
+    """Delete exports older than ``max_age`` seconds; returns how many."""
+    directory = _directory()
+    expired = 0
+    cutoff = time.time() - max_age
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                expired += 1
+        except FileNotFoundError:
+            # Another session removed it first
+            pass
+    return expired
+
+
+def export_file(suffix):
+    """A new binary file in this process's export directory, after clearing expired ones.
+
+    The caller closes it; the path stays valid until it expires or is removed.
+    """
+    remove_expired()
+    return tempfile.NamedTemporaryFile(dir=_directory(), suffix=suffix, delete=False)
+
+
+def iter_chunks(user_id, chunk_size=CHUNK_SIZE):
+    """Yield lists of export rows, oldest night first."""
+    backend = db.get_backend()
+    columns = f"""
+            id,
+            date,
+            {backend.time_text("sleep_time")} AS sleep_time,
+            {backend.time_text("wake_time")} AS wake_time,
+            duration_hours,
+            sleep_quality,
+            notes,
+            created_at
+    """
+    # Archived nights are part of the export
+    query = db.sql(f"""
+        SELECT * FROM {retention.union(columns, "user_id = %s")}
+        ORDER BY date, id
+    """)
+    with db.connection() as conn:
+        cursor = backend.streaming_cursor(conn)
+        try:
+            cursor.execute(query, (user_id,) * 2)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                # Dates and timestamps come back as objects (MySQL) or text (SQLite)
+                yield [(row[0], str(row[1]), row[2], row[3], row[4], row[5], row[6],
+                        None if row[7] is None else str(row[7])) for row in rows]
+        finally:
+            cursor.close()
+
+
+def write_csv(user_id, stream, chunk_size=CHUNK_SIZE):
+    """Write the export to a text stream; returns the number of rows."""
+    writer = csv.writer(stream)
+    writer.writerow(COLUMNS)
+    count = 0
+    for rows in iter_chunks(user_id, chunk_size):
+        writer.writerows(rows)
+        count += len(rows)
+    return count
+
+
+def write_parquet(user_id, sink, chunk_size=CHUNK_SIZE):
+    """Write the export as one Parquet row group per chunk; returns the number of rows."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ('id', pa.int64()),
+        ('date', pa.string()),
+        ('sleep_time', pa.string()),
+        ('wake_time', pa.string()),
+        ('duration_hours', pa.float64()),
+        ('sleep_quality', pa.int8()),
+        ('notes', pa.string()),
+        ('created_at', pa.string()),
+    ])
+    count = 0
+    with pq.ParquetWriter(sink, schema) as writer:
+        for rows in iter_chunks(user_id, chunk_size):
+            columns = list(zip(*rows))
+            table = pa.Table.from_arrays(
+                [pa.array(values, type=col.type) for values, col in zip(columns, schema)],
+                schema=schema,
+            )
+            writer.write_table(table)
+            count += len(rows)
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export a user's sleep log.")
+    parser.add_argument("path")
+    parser.add_argument("--user-id", type=int, required=True)
+    parser.add_argument("--format", choices=("csv", "parquet"), default="csv")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    if args.format == "parquet":
+        count = write_parquet(args.user_id, args.path, args.chunk_size)
+    else:
+        with open(args.path, "w", newline="", encoding="utf-8") as stream:
+            count = write_csv(args.user_id, stream, args.chunk_size)
+    print(f"{count} rows written to {args.path}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
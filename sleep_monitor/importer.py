@@ -0,0 +1,212 @@
+"""Streaming bulk import of historical sleep data.
+
+Reads CSV, JSON arrays or JSON Lines in fixed-size chunks, validates every
+row with the same rules as the dashboard form and writes each chunk with a
+single ``executemany`` inside its own transaction.  Memory use is bounded by
+the chunk size, not the file size.
+
+    python -m sleep_monitor.importer --user-id 1 export.csv
+"""
+import argparse
+import csv
+import itertools
+import json
+import re
+import sys
+from dataclasses import dataclass, field
+from datetime import date, datetime, time
+
+from sleep_monitor import db, migrations
+from sleep_monitor.cache import user_cache
+from sleep_monitor.validation import validate_entry
+from sleep_monitor.writes import insert_nights
+
+CHUNK_SIZE = 5000
+BLOCK_SIZE = 65536
+MAX_ERRORS = 20
+
+_SEPARATORS = re.compile(r"[\s,]*")
+
+# Accepted spellings of each field in third-party exports
+FIELD_ALIASES = {
+    'date': ('date', 'night', 'day'),
+    'sleep_time': ('sleep_time', 'bedtime', 'start', 'sleep_start'),
+    'wake_time': ('wake_time', 'waketime', 'end', 'sleep_end'),
+    'sleep_quality': ('sleep_quality', 'quality', 'rating'),
+    'notes': ('notes', 'note', 'comment'),
+}
+
+
+@dataclass
+class ImportResult:
+    imported: int = 0
+    rejected: int = 0
+    errors: list = field(default_factory=list)
+    # Set when the file itself could not be read to the end
+    error: str = None
+
+
+# Readers
+def _chunked(records, chunk_size):
+    while True:
+        chunk = list(itertools.islice(records, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _iter_json_array(buffer, stream):
+    decoder = json.JSONDecoder()
+    buffer = buffer.lstrip()[1:]
+    pos = 0
+    eof = False
+    while True:
+        pos = _SEPARATORS.match(buffer, pos).end()
+        if buffer.startswith("]", pos):
+            return
+        try:
+            record, pos = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            # Record cut at the block boundary: read more and retry
+            if eof:
+                raise
+            block = stream.read(BLOCK_SIZE)
+            eof = not block
+            buffer = buffer[pos:] + block
+            pos = 0
+            continue
+        yield record
+
+
+def read_csv_chunks(stream, chunk_size=CHUNK_SIZE):
+    return _chunked(iter(csv.DictReader(stream)), chunk_size)
+
+
+def read_json_chunks(stream, chunk_size=CHUNK_SIZE):
+    """Chunks from a JSON array or a JSON Lines stream."""
+    head = stream.read(BLOCK_SIZE)
+    if head.lstrip().startswith("["):
+        records = _iter_json_array(head, stream)
+    else:
+        # Finish the line cut by the first block, then stream the rest
+        lines = itertools.chain((head + stream.readline()).splitlines(), stream)
+        records = (json.loads(line) for line in lines if line.strip())
+    yield from _chunked(records, chunk_size)
+
+
+# Row parsing
+def _field(record, name):
+    for alias in FIELD_ALIASES[name]:
+        value = record.get(alias)
+        if value not in (None, ""):
+            return value
+    return None
+
+
+def _parse_moment(value):
+    """``(date or None, time)`` from "HH:MM[:SS]" or an ISO date-time."""
+    value = str(value).strip()
+    if "T" in value or " " in value:
+        moment = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        return moment.date(), moment.time().replace(microsecond=0, tzinfo=None)
+    return None, time.fromisoformat(value)
+
+
+def parse_record(record):
+    """Turn one input record into a sleep_log row (without user_id)."""
+    sleep_day, sleep_time = _parse_moment(_field(record, 'sleep_time'))
+    wake_day, wake_time = _parse_moment(_field(record, 'wake_time'))
+    raw_date = _field(record, 'date')
+    if raw_date is not None:
+        log_date = date.fromisoformat(str(raw_date)[:10])
+    elif wake_day or sleep_day:
+        # The dashboard logs a night under the day you wake up
+        log_date = wake_day or sleep_day
+    else:
+        raise ValueError("missing date")
+    quality = int(float(_field(record, 'sleep_quality')))
+    _, error = validate_entry(sleep_time, wake_time, quality)
+    if error:
+        raise ValueError(error)
+    return log_date, sleep_time, wake_time, quality, _field(record, 'notes')
+
+
+# Import
+def import_chunks(user_id, chunks, progress=None):
+    """Validate and insert chunks of records; one transaction per chunk.
+
+    ``progress(result)`` is called after every committed chunk.
+    """
+    result = ImportResult()
+    row_number = 0
+    chunks = iter(chunks)
+    try:
+        with db.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                while True:
+                    try:
+                        chunk = next(chunks, None)
+                    except (UnicodeDecodeError, json.JSONDecodeError, csv.Error) as exc:
+                        # Earlier chunks are committed; the one being read is dropped
+                        result.error = (f"Could not read the file after {row_number} rows: {exc}. "
+                                        f"{result.imported} rows were imported before that.")
+                        break
+                    if chunk is None:
+                        break
+                    rows = []
+                    for record in chunk:
+                        row_number += 1
+                        try:
+                            rows.append((user_id,) + parse_record(record))
+                        except (AttributeError, TypeError, ValueError) as exc:
+                            result.rejected += 1
+                            if len(result.errors) < MAX_ERRORS:
+                                result.errors.append(f"row {row_number}: {exc}")
+                    if rows:
+                        insert_nights(cursor, rows)
+                        conn.commit()
+                        result.imported += len(rows)
+                    if progress:
+                        progress(result)
+            finally:
+                cursor.close()
+    finally:
+        if result.imported:
+            user_cache.bump(user_id)
+    return result
+
+
+def import_file(user_id, stream, fmt, chunk_size=CHUNK_SIZE, progress=None):
+    """Import a text stream in ``fmt`` ("csv" or "json")."""
+    reader = read_csv_chunks if fmt == "csv" else read_json_chunks
+    return import_chunks(user_id, reader(stream, chunk_size), progress=progress)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import sleep history.")
+    parser.add_argument("path")
+    parser.add_argument("--user-id", type=int, required=True)
+    parser.add_argument("--format", choices=("csv", "json"))
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    migrations.ensure_schema()
+    fmt = args.format or ("csv" if args.path.lower().endswith(".csv") else "json")
+
+    def report(result):
+        print(f"\r{result.imported} imported, {result.rejected} rejected", end="", file=sys.stderr)
+
+    with open(args.path, newline="", encoding="utf-8") as stream:
+        result = import_file(args.user_id, stream, fmt, args.chunk_size, progress=report)
+    print(file=sys.stderr)
+    for error in result.errors:
+        print(error, file=sys.stderr)
+    if result.error:
+        print(result.error, file=sys.stderr)
+        return 1
+    return 0 if result.imported or not result.rejected else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,266 @@
+"""Incremental loading of a user's sleep_log history.
+
+The cached history remembers the highest ``sleep_log.id`` it contains.  When
+the user's data version moves on, only rows above that watermark are fetched
+and appended.  A row-count check catches deletions.
+
+Writes from this process bump the version themselves.  Changes made
+elsewhere (another server process, a script, a manual UPDATE or DELETE)
+leave no trace an id or count probe could see, so every cached entry
+expires instead: ``revalidate()`` drops the user's entries once they are
+``SLEEP_RESYNC_SECONDS`` old and the next read reloads the history in full.
+``resync(user_id)`` does the same immediately.
+"""
+import os
+import threading
+import time
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from sleep_monitor import db, profiling, records, retention, rollups, write_queue
+from sleep_monitor.cache import user_cache
+
+RESYNC_SECONDS = float(os.environ.get("SLEEP_RESYNC_SECONDS", "300"))
+
+stats = {"full": 0, "delta": 0, "resync": 0}
+
+_lock = threading.Lock()
+_synced = {}  # user_id -> monotonic time the user's entries started filling
+
+
+def _select_query(condition):
+    # Reads both tiers, so parameters are passed twice (see retention.union)
+    backend = db.get_backend()
+    columns = f"""
+            id,
+            date,
+            {backend.time_to_sec("sleep_time")} as sleep_sec,
+            {backend.time_to_sec("wake_time")} as wake_sec,
+            duration_hours,
+            sleep_quality,
+            notes
+    """
+    return db.sql(f"""
+        SELECT * FROM {retention.union(columns, f"user_id = %s AND {condition}")}
+        ORDER BY date DESC, id DESC
+    """)
+
+
+def _history_query():
+    return _select_query("id > %s")
+
+
+def _window_query():
+    return _select_query("date BETWEEN %s AND %s")
+
+
+def _as_date(value):
+    # SQLite hands DATE columns back as ISO strings
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def _read_frame(conn, query, params):
+    cursor = conn.cursor()
+    try:
+        with profiling.span("db.query") as span:
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
+            span.tag(rows=len(rows))
+    finally:
+        cursor.close()
+    with profiling.span("records.from_rows", rows=len(rows)):
+        return records.from_rows(rows)
+
+
+def _fetch_rows(conn, user_id, after_id=0):
+    return _read_frame(conn, _history_query(), (user_id, after_id) * 2)
+
+
+def _row_count(conn, user_id):
+    cursor = conn.cursor()
+    try:
+        cursor.execute(db.sql(f"SELECT COUNT(*) FROM {retention.union('id', 'user_id = %s')}"), (user_id,) * 2)
+        return cursor.fetchone()[0]
+    finally:
+        cursor.close()
+
+
+def revalidate(user_id):
+    """Drop the user's cached entries once they are ``RESYNC_SECONDS`` old.
+
+    Every reader of a cached entry calls this first, so edits made outside
+    this process show up within ``RESYNC_SECONDS``.
+    """
+    now = time.monotonic()
+    with _lock:
+        synced = _synced.setdefault(user_id, now)
+        if now - synced < RESYNC_SECONDS:
+            return
+        _synced[user_id] = now
+    stats["resync"] += 1
+    user_cache.invalidate(user_id)
+
+
+def _watermark(df):
+    return int(df['id'].max()) if not df.empty else 0
+
+
+def _refresh(user_id, stale):
+    with db.connection() as conn:
+        if stale is not None:
+            df, watermark, synced_at = stale
+            if time.monotonic() - synced_at < RESYNC_SECONDS:
+                delta = _fetch_rows(conn, user_id, after_id=watermark)
+                if len(df) + len(delta) == _row_count(conn, user_id):
+                    stats["delta"] += 1
+                    if delta.empty:
+                        return df, watermark, synced_at
+                    df = pd.concat([delta, df], ignore_index=True)
+                    df = df.sort_values(['date', 'id'], ascending=False, ignore_index=True)
+                    return df, _watermark(df), synced_at
+            # Rows were deleted/edited or the copy is old: fall back to a full load
+            stats["resync"] += 1
+        stats["full"] += 1
+        df = _fetch_rows(conn, user_id)
+        return df, _watermark(df), time.monotonic()
+
+
+def load_user_data(user_id):
+    """Return the user's full sleep history, newest first."""
+    revalidate(user_id)
+    entry = user_cache.get(user_id, "history")
+    if entry is None:
+        version = user_cache.version(user_id)
+        stale = user_cache.peek(user_id, "history")
+        with profiling.span("loader.history") as span:
+            entry = _refresh(user_id, stale[1] if stale else None)
+            span.tag(rows=len(entry[0]))
+        user_cache.put(user_id, "history", entry, version=version)
+    # Shallow copy so per-rerun column additions never leak into the cache
+    return entry[0].copy(deep=False)
+
+
+def load_after(user_id, after_id=0):
+    """The user's rows with ``id`` above ``after_id``, newest first, uncached.
+
+    For callers that keep their own incremental state and only need the
+    nights added since they last looked.
+    """
+    with profiling.span("loader.after") as span, db.connection() as conn:
+        df = _fetch_rows(conn, user_id, after_id)
+        span.tag(rows=len(df))
+    return df
+
+
+def load_window(user_id, start, end):
+    """Rows dated ``start``..``end`` inclusive, newest first.
+
+    Served from the cached full history when one is current, otherwise
+    fetched with a ``date BETWEEN`` query so transfer and memory scale with
+    the window rather than the account.
+    """
+    revalidate(user_id)
+    key = ("window", start, end)
+    df = user_cache.get(user_id, key)
+    if df is None:
+        history = user_cache.peek(user_id, "history")
+        version = user_cache.version(user_id)
+        with profiling.span("loader.window") as span:
+            if history is not None and history[0] == version:
+                full = history[1][0]
+                df = full[(full['date'] >= pd.Timestamp(start)) & (full['date'] <= pd.Timestamp(end))]
+                span.tag(source="history")
+            else:
+                with db.connection() as conn:
+                    df = _read_frame(conn, _window_query(), (user_id, start, end) * 2)
+                span.tag(source="sql")
+            span.tag(rows=len(df))
+        user_cache.put(user_id, key, df, version=version)
+    if write_queue.enabled():
+        df = _with_pending(df, user_id, start, end)
+    return df.copy(deep=False)
+
+
+def _with_pending(df, user_id, start, end):
+    # Submissions still in the write-behind journal show up straight away
+    pending = write_queue.pending_frame(user_id)
+    pending = pending[(pending['date'] >= pd.Timestamp(start)) & (pending['date'] <= pd.Timestamp(end))]
+    if pending.empty:
+        return df
+    df = pd.concat([pending, df], ignore_index=True)
+    return df.sort_values(['date', 'id'], ascending=False, ignore_index=True)
+
+
+def date_bounds(user_id):
+    """``(first_date, last_date, nights)`` for the user, or None without data."""
+    revalidate(user_id)
+    bounds = user_cache.get(user_id, "bounds")
+    if bounds is None:
+        version = user_cache.version(user_id)
+        with profiling.span("loader.bounds"), db.cursor() as cursor:
+            cursor.execute(
+                db.sql(f"SELECT MIN(date), MAX(date), COUNT(*) FROM {retention.union('date', 'user_id = %s')}"),
+                (user_id,) * 2,
+            )
+            first, last, nights = cursor.fetchone()
+        if write_queue.enabled():
+            pending = write_queue.pending_frame(user_id)
+            if not pending.empty:
+                dates = [_as_date(first), _as_date(last)] if nights else []
+                dates += [pending['date'].min().date(), pending['date'].max().date()]
+                first, last, nights = min(dates), max(dates), nights + len(pending)
+        bounds = (_as_date(first), _as_date(last), nights) if nights else ()
+        user_cache.put(user_id, "bounds", bounds, version=version)
+    return bounds or None
+
+
+def load_summary(user_id):
+    """All-time averages and quality counts, summed from monthly rollups."""
+    revalidate(user_id)
+    summary = user_cache.get(user_id, "summary")
+    if summary is None:
+        version = user_cache.version(user_id)
+        with profiling.span("loader.summary"):
+            totals = rollups.range_totals(user_id)
+        if write_queue.enabled():
+            # metrics imports this module, so it is imported here rather than at the top
+            from sleep_monitor import metrics
+            # Queued submissions are not in the rollups until they are flushed
+            totals = metrics.add_totals(totals, metrics.totals(write_queue.pending_frame(user_id)))
+        nights, rated = totals['nights'], totals['rated']
+        avg_duration = totals['duration_sum'] / nights if nights else 0.0
+        counts = totals['quality_counts']
+        summary = {
+            'nights': nights,
+            'avg_duration': avg_duration,
+            'avg_quality': totals['quality_sum'] / rated if rated else 0.0,
+            'efficiency': avg_duration / 8 * 100,
+            'quality_counts': pd.DataFrame({
+                'sleep_quality': np.arange(1, 6)[counts > 0],
+                'nights': counts[counts > 0],
+            }),
+        }
+        user_cache.put(user_id, "summary", summary, version=version)
+    return summary
+
+
+def explain(user_id):
+    """Query plan of the history query, as rows of strings."""
+    backend = db.get_backend()
+    with db.cursor() as cursor:
+        cursor.execute(backend.explain(_history_query()), (user_id, 0) * 2)
+        return [" ".join(str(col) for col in row) for row in cursor.fetchall()]
+
+
+def uses_user_date_index(user_id):
+    """Whether the history query's plan reads ``idx_sleep_log_user_date``."""
+    return any("idx_sleep_log_user_date" in row for row in explain(user_id))
+
+
+def resync(user_id):
+    """Drop the user's cached entries so the next load re-reads every row."""
+    with _lock:
+        _synced[user_id] = time.monotonic()
+    user_cache.invalidate(user_id)
@@ -0,0 +1,163 @@
+"""Single-pass sleep metrics over compact record frames.
+
+Plain NumPy/pandas with no Streamlit dependency, shared by the dashboard and
+the headless batch runner (``sleep_monitor.batch``).
+"""
+import numpy as np
+import pandas as pd
+
+from sleep_monitor import loader, profiling, records, rollups, write_queue
+from sleep_monitor.cache import user_cache
+
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+# Sleep efficiency is measured against an 8 hour night
+TARGET_HOURS = 8.0
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def _mean_std(total, total_sq, n):
+    if n == 0:
+        return np.nan, np.nan
+    mean = total / n
+    if n < 2:
+        return mean, np.nan
+    # Sample standard deviation (ddof=1), matching pandas
+    var = max(total_sq - total * mean, 0.0) / (n - 1)
+    return mean, np.sqrt(var)
+
+
+def totals(df):
+    """Sufficient statistics of ``df``: counts, sums and sums of squares.
+
+    The same shape is summed from rollup rows, so both feed ``from_totals``.
+    """
+    duration = df['duration'].to_numpy(dtype=np.float64)
+    quality = df['sleep_quality'].to_numpy()
+    hour = records.sleep_hour(df).astype(np.float64)
+    weekday = records.weekday(df)
+
+    # Sums and sums of squares for every statistic in one reduction
+    rated = quality != records.UNRATED
+    q = np.where(rated, quality, 0).astype(np.float64)
+    sums = np.stack([duration, duration * duration, q, q * q, hour, hour * hour]).sum(axis=1)
+    return {
+        'nights': len(duration),
+        'rated': int(rated.sum()),
+        'duration_sum': sums[0],
+        'duration_sq': sums[1],
+        'quality_sum': sums[2],
+        'quality_sq': sums[3],
+        'hour_sum': sums[4],
+        'hour_sq': sums[5],
+        'quality_counts': np.bincount(quality[rated], minlength=6)[1:6],
+        'weekday_nights': np.bincount(weekday, minlength=7),
+        'weekday_hours': np.bincount(weekday, weights=duration, minlength=7),
+    }
+
+
+def add_totals(a, b):
+    return {key: a[key] + b[key] for key in a}
+
+
+def from_totals(t):
+    """Metrics from sufficient statistics, in the shape of ``calculate_sleep_metrics``"""
+    n, n_rated = t['nights'], t['rated']
+
+    metrics = {}
+    metrics['avg_duration'], metrics['duration_std'] = _mean_std(t['duration_sum'], t['duration_sq'], n)
+    metrics['avg_quality'], metrics['quality_std'] = _mean_std(t['quality_sum'], t['quality_sq'], n_rated)
+    _, metrics['sleep_time_std'] = _mean_std(t['hour_sum'], t['hour_sq'], n)
+    metrics['efficiency'] = metrics['avg_duration'] / TARGET_HOURS * 100
+
+    # Quality distribution
+    counts = np.asarray(t['quality_counts'])
+    present = counts > 0
+    metrics['quality_dist'] = pd.DataFrame({
+        'quality': np.arange(1, 6)[present],
+        'percentage': counts[present] / max(n_rated, 1) * 100,
+    })
+
+    # Weekly patterns
+    nights = np.asarray(t['weekday_nights'])
+    hours = np.asarray(t['weekday_hours'], dtype=np.float64)
+    present = nights > 0
+    metrics['weekly_pattern'] = pd.DataFrame({
+        'weekday': np.array(WEEKDAYS)[present],
+        'duration': hours[present] / nights[present],
+    })
+
+    return metrics
+
+
+def calculate_sleep_metrics(df):
+    """Calculate detailed sleep metrics without modifying ``df``"""
+    return from_totals(totals(df))
+
+
+def _occupancy(wake, length):
+    """Per minute of the week, how many ``[wake - length, wake)`` intervals cover it.
+
+    Every interval becomes a +1 and a -1 edge on a minute-of-week axis; a
+    bincount and cumsum turn the edges into counts without looping.
+    """
+    week = 7 * MINUTES_PER_DAY
+    start = (wake - length) % week
+    end = start + length
+    # Intervals running past the end of the week continue from Monday 00:00
+    wrapped = end > week
+    edges = np.concatenate([start, np.minimum(end, week), np.zeros(wrapped.sum(), dtype=np.int64), end[wrapped] - week])
+    weights = np.concatenate([np.ones(len(start)), -np.ones(len(start)),
+                              np.ones(wrapped.sum()), -np.ones(wrapped.sum())])
+    return np.cumsum(np.bincount(edges, weights=weights, minlength=week + 1)[:week])
+
+
+def create_sleep_heatmap(df, bin_minutes=15):
+    """Share of nights asleep in each ``bin_minutes`` slot of the week.
+
+    Returns a frame indexed by weekday with one "HH:MM" column per slot.
+    A night is logged under the day you wake up, so it occupies the
+    minutes from wake time minus duration up to wake time, wrapping across
+    midnight and from Sunday into Monday.  A slot's share is taken over the
+    nights that could have covered it: those whose 24 hours up to wake time
+    include the slot, so unevenly logged weekdays never push it past 1.
+
+    >>> wake = pd.to_datetime(['2024-01-01', '2024-01-08', '2024-01-15', '2024-01-22', '2024-01-07'])
+    >>> df = pd.DataFrame({'date': wake, 'wake_sec': [6 * 3600] * 4 + [15 * 3600],
+    ...                    'duration': [8.0, 8.0, 6.0, 6.0, 1.0]})
+    >>> float(create_sleep_heatmap(df).loc['Sunday', '22:00'])
+    0.5
+    """
+    days = df['date'].to_numpy().astype('datetime64[D]').astype(np.int64)
+    wake = (days + 3) % 7 * MINUTES_PER_DAY + df['wake_sec'].to_numpy() // 60
+    length = np.rint(df['duration'].to_numpy(dtype=np.float64) * 60).astype(np.int64)
+    asleep = _occupancy(wake, length)
+    logged = _occupancy(wake, np.full(len(wake), MINUTES_PER_DAY))
+
+    # Minutes asleep over minutes logged within each bin
+    shape = (7, MINUTES_PER_DAY // bin_minutes, bin_minutes)
+    asleep = asleep.reshape(shape).sum(axis=2)
+    logged = logged.reshape(shape).sum(axis=2)
+    share = asleep / np.maximum(logged, 1)
+    labels = [f"{minute // 60:02d}:{minute % 60:02d}" for minute in range(0, MINUTES_PER_DAY, bin_minutes)]
+    return pd.DataFrame(share, index=WEEKDAYS, columns=labels)
+
+
+def window_metrics(user_id, start, end):
+    """Metrics for ``start``..``end`` from rollup rows, memoized by data version."""
+    loader.revalidate(user_id)
+    key = ("metrics", start, end)
+    metrics = user_cache.get(user_id, key)
+    if metrics is None:
+        version = user_cache.version(user_id)
+        with profiling.span("metrics.rollup"):
+            window = rollups.range_totals(user_id, start, end)
+        if write_queue.enabled():
+            # Queued submissions are not in the rollups until they are flushed
+            pending = write_queue.pending_frame(user_id)
+            pending = pending[(pending['date'] >= pd.Timestamp(start)) & (pending['date'] <= pd.Timestamp(end))]
+            window = add_totals(window, totals(pending))
+        metrics = from_totals(window)
+        user_cache.put(user_id, key, metrics, version=version)
+    return metrics
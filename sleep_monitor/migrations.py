@@ -0,0 +1,202 @@
+"""Versioned schema migrations.
+
+Each migration is an ordered, idempotent step recorded in ``schema_version``.
+``ensure_schema()`` applies whatever is pending the first time it is called
+in a server process and is a no-op (no database round-trip) afterwards, so
+Streamlit reruns never touch the schema.
+"""
+import threading
+
+from sleep_monitor import db
+
+
+# Migration steps
+def _create_users(cursor, backend):
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS users (
+            id {backend.autoincrement_pk},
+            username VARCHAR(50) NOT NULL UNIQUE,
+            password VARCHAR(255) NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def _create_sleep_log(cursor, backend):
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS sleep_log (
+            id {backend.autoincrement_pk},
+            user_id INT NOT NULL,
+            date DATE NOT NULL,
+            sleep_time TIME NOT NULL,
+            wake_time TIME NOT NULL,
+            sleep_quality INT CHECK (sleep_quality BETWEEN 1 AND 5),
+            notes TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+    """)
+
+
+def _add_sleep_log_details(cursor, backend):
+    # Older deployments created sleep_log before these columns existed
+    if not backend.column_exists(cursor, "sleep_log", "sleep_quality"):
+        cursor.execute("ALTER TABLE sleep_log ADD COLUMN sleep_quality INT CHECK (sleep_quality BETWEEN 1 AND 5)")
+    if not backend.column_exists(cursor, "sleep_log", "notes"):
+        cursor.execute("ALTER TABLE sleep_log ADD COLUMN notes TEXT")
+    if not backend.column_exists(cursor, "sleep_log", "created_at"):
+        cursor.execute("ALTER TABLE sleep_log ADD COLUMN created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP")
+
+
+def _duration_expression(backend):
+    sleep_sec = backend.time_to_sec("sleep_time")
+    wake_sec = backend.time_to_sec("wake_time")
+    return f"""CASE
+        WHEN {wake_sec} < {sleep_sec}
+        THEN ({wake_sec} + 86400 - {sleep_sec}) / 3600.0
+        ELSE ({wake_sec} - {sleep_sec}) / 3600.0
+    END"""
+
+
+def _index_user_date_and_store_duration(cursor, backend):
+    if not backend.column_exists(cursor, "sleep_log", "duration_hours"):
+        column = backend.generated_column("duration_hours", "DOUBLE", _duration_expression(backend))
+        cursor.execute(f"ALTER TABLE sleep_log ADD COLUMN {column}")
+    if not backend.index_exists(cursor, "sleep_log", "idx_sleep_log_user_date"):
+        cursor.execute("CREATE INDEX idx_sleep_log_user_date ON sleep_log (user_id, date)")
+
+
+def _create_user_metrics(cursor, backend):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_metrics (
+            user_id INT PRIMARY KEY,
+            nights INT NOT NULL,
+            first_date DATE,
+            last_date DATE,
+            avg_duration DOUBLE,
+            duration_std DOUBLE,
+            avg_quality DOUBLE,
+            quality_std DOUBLE,
+            sleep_time_std DOUBLE,
+            efficiency DOUBLE,
+            weekly_pattern TEXT,
+            quality_dist TEXT,
+            computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+    """)
+
+
+def _create_sleep_rollup(cursor, backend):
+    # rollups needs numpy and pandas, which the login page never loads otherwise
+    from sleep_monitor import rollups
+    rollups.create_table(cursor)
+    # Existing histories are rolled up once; inserts keep them current afterwards.
+    # Only sleep_log exists at this version; the archive arrives in step 9.
+    rollups.rebuild(cursor, archive=False)
+
+
+def _index_sleep_log_notes(cursor, backend):
+    backend.create_notes_index(cursor)
+
+
+def _create_cohort(cursor, backend):
+    from sleep_monitor import cohort
+    cohort.create_tables(cursor, backend)
+    cohort.build(cursor, archive=False)
+
+
+def _create_sleep_log_archive(cursor, backend):
+    from sleep_monitor import retention
+    # Starts empty, so the rollups and cohort sums built from sleep_log stay complete
+    retention.create_tables(cursor)
+
+
+def _create_write_queue_applied(cursor, backend):
+    # Idempotency keys of write-behind rows already in sleep_log
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS write_queue_applied (
+            journal VARCHAR(32) NOT NULL,
+            entry_id INT NOT NULL,
+            PRIMARY KEY (journal, entry_id)
+        )
+    """)
+
+
+def _index_sleep_log_archive_notes(cursor, backend):
+    from sleep_monitor import retention
+    backend.create_notes_index(cursor, retention.ARCHIVE_TABLE)
+
+
+MIGRATIONS = [
+    (1, "create users", _create_users),
+    (2, "create sleep_log", _create_sleep_log),
+    (3, "add sleep_log quality, notes and created_at", _add_sleep_log_details),
+    (4, "index sleep_log (user_id, date) and store duration_hours", _index_user_date_and_store_duration),
+    (5, "create user_metrics", _create_user_metrics),
+    (6, "create and backfill sleep_rollup", _create_sleep_rollup),
+    (7, "full-text index sleep_log notes", _index_sleep_log_notes),
+    (8, "create and build cohort percentile sketches", _create_cohort),
+    (9, "create sleep_log archive tier", _create_sleep_log_archive),
+    (10, "create write_queue_applied", _create_write_queue_applied),
+    (11, "full-text index sleep_log_archive notes", _index_sleep_log_archive_notes),
+]
+
+
+# Engine
+def _applied_versions(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INT PRIMARY KEY,
+            name VARCHAR(100) NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("SELECT version FROM schema_version")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def migrate(target=None):
+    """Apply pending migrations in order, up to ``target`` if given.
+
+    Returns the versions that were applied.
+    """
+    backend = db.get_backend()
+    applied = []
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            done = _applied_versions(cursor)
+            conn.commit()
+            for version, name, step in MIGRATIONS:
+                if version in done or (target is not None and version > target):
+                    continue
+                step(cursor, backend)
+                try:
+                    cursor.execute(
+                        db.sql("INSERT INTO schema_version (version, name) VALUES (%s, %s)"),
+                        (version, name),
+                    )
+                except backend.IntegrityError:
+                    # Another process recorded the same step first
+                    pass
+                conn.commit()
+                applied.append(version)
+        finally:
+            cursor.close()
+    return applied
+
+
+_lock = threading.Lock()
+_schema_ready = False
+
+
+def ensure_schema():
+    """Run pending migrations once per process."""
+    global _schema_ready
+    if _schema_ready:
+        return
+    with _lock:
+        if not _schema_ready:
+            migrate()
+            _schema_ready = True
@@ -0,0 +1,80 @@
+"""Full-text search and keyset-paginated browsing of sleep notes.
+
+Matching uses the backend's full-text index (a FULLTEXT index on MySQL,
+an FTS5 table on SQLite); every word of the query must match as a prefix.
+Pages are ordered newest first and continue from the ``(date, id)`` of
+the previous page's last row, so page N costs the same as page 1.
+Archived nights (``sleep_monitor.retention``) have an index of their own,
+built the same way, so both tiers split words identically.
+"""
+import html
+import re
+from dataclasses import dataclass
+
+from sleep_monitor import db, profiling, retention
+
+PAGE_SIZE = 20
+
+_WORDS = re.compile(r"\w+", re.UNICODE)
+
+
+@dataclass
+class NotesPage:
+    rows: list            # (id, date, notes) tuples
+    next_cursor: tuple    # pass as ``after`` for the following page; None on the last
+
+
+def words(query):
+    return _WORDS.findall(query or "")
+
+
+def search_notes(user_id, query="", start=None, end=None, after=None, limit=PAGE_SIZE):
+    """One page of the user's notes matching ``query``, newest first."""
+    backend = db.get_backend()
+    conditions = ["user_id = %s", "notes IS NOT NULL", "notes <> ''"]
+    params = [user_id]
+    if start is not None and end is not None:
+        conditions.append("date BETWEEN %s AND %s")
+        params += [start, end]
+    if after is not None:
+        conditions.append("(date < %s OR (date = %s AND id < %s))")
+        params += [after[0], after[0], after[1]]
+    hot, hot_params = list(conditions), list(params)
+    archive, archive_params = list(conditions), list(params)
+    terms = words(query)
+    if terms:
+        hot.append(backend.notes_match())
+        hot_params.append(backend.notes_query(terms))
+        archive.append(backend.notes_match(retention.ARCHIVE_TABLE))
+        archive_params.append(backend.notes_query(terms))
+    with profiling.span("notes.search") as span, db.cursor() as cursor:
+        cursor.execute(
+            db.sql(f"""
+                SELECT id, date, notes
+                FROM {retention.union("id, date, notes", " AND ".join(hot), " AND ".join(archive))}
+                ORDER BY date DESC, id DESC
+                LIMIT %s
+            """),
+            hot_params + archive_params + [limit + 1],
+        )
+        rows = cursor.fetchall()
+        span.tag(rows=len(rows))
+    # The extra row only tells whether another page exists
+    next_cursor = (rows[limit - 1][1], rows[limit - 1][0]) if len(rows) > limit else None
+    return NotesPage(rows[:limit], next_cursor)
+
+
+def highlight(text, query):
+    """HTML-escaped ``text`` with words starting with a query term wrapped in ``<mark>``."""
+    terms = words(query)
+    if not terms:
+        return html.escape(text)
+    pattern = re.compile(r"\b(?:%s)\w*" % "|".join(re.escape(term) for term in terms), re.IGNORECASE)
+    parts = []
+    last = 0
+    for match in pattern.finditer(text):
+        parts.append(html.escape(text[last:match.start()]))
+        parts.append(f"<mark>{html.escape(match.group())}</mark>")
+        last = match.end()
+    parts.append(html.escape(text[last:]))
+    return "".join(parts)
@@ -0,0 +1,172 @@
+"""Lightweight timing spans for dashboard reruns.
+
+Spans are only recorded while a trace is active on the current thread
+(one Streamlit rerun), so with profiling off ``span()`` costs one
+thread-local lookup and returns a shared no-op.  Every finished span also
+feeds process-wide per-name totals and a latency histogram, exported as
+JSON or Prometheus text.
+
+    with profiling.trace(active) as spans:
+        with profiling.span("loader.history") as span:
+            df = ...
+            span.tag(rows=len(df))
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+ENABLED = os.environ.get("SLEEP_PROFILE", "0") == "1"
+
+# Histogram bucket upper bounds, in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_local = threading.local()
+_lock = threading.Lock()
+_totals = {}
+
+
+class Span:
+    __slots__ = ("name", "tags", "start", "duration", "depth", "_spans")
+
+    def __init__(self, name, tags, spans):
+        self.name = name
+        self.tags = tags
+        self._spans = spans
+
+    def tag(self, **tags):
+        self.tags.update(tags)
+
+    def __enter__(self):
+        self.depth = _local.depth
+        _local.depth += 1
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.duration = time.perf_counter() - self.start
+        _local.depth -= 1
+        self._spans.append(self)
+        _record(self)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def tag(self, **tags):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL = _NullSpan()
+
+
+def span(name, **tags):
+    """Time a ``with`` block under ``name``; ``rows=`` and other tags are kept."""
+    spans = getattr(_local, "spans", None)
+    if spans is None:
+        return _NULL
+    return Span(name, tags, spans)
+
+
+@contextmanager
+def trace(active=True):
+    """Record this thread's spans; yields their list, or None when inactive.
+
+    Nested traces (a fragment inside a full run) join the outer one and
+    yield None.
+    """
+    if not active or getattr(_local, "spans", None) is not None:
+        yield None
+        return
+    spans = []
+    _local.spans, _local.depth, _local.origin = spans, 0, time.perf_counter()
+    try:
+        yield spans
+    finally:
+        _local.spans = None
+        for item in spans:
+            item.start -= _local.origin
+
+
+def _record(item):
+    rows = item.tags.get("rows", 0)
+    with _lock:
+        total = _totals.get(item.name)
+        if total is None:
+            total = _totals[item.name] = {"count": 0, "seconds": 0.0, "rows": 0,
+                                          "buckets": [0] * len(BUCKETS)}
+        total["count"] += 1
+        total["seconds"] += item.duration
+        total["rows"] += rows
+        for i, bound in enumerate(BUCKETS):
+            if item.duration <= bound:
+                total["buckets"][i] += 1
+                break
+
+
+def reset():
+    with _lock:
+        _totals.clear()
+
+
+# Export
+def span_rows(spans):
+    """Spans of one trace as dicts in start order (times in milliseconds)."""
+    return [
+        dict(name=item.name, depth=item.depth, start_ms=item.start * 1000,
+             duration_ms=item.duration * 1000, **item.tags)
+        for item in sorted(spans, key=lambda item: (item.start, item.depth))
+    ]
+
+
+def snapshot():
+    """Process-wide totals per span name."""
+    with _lock:
+        return {
+            name: {"count": total["count"], "total_ms": total["seconds"] * 1000,
+                   "mean_ms": total["seconds"] * 1000 / total["count"], "rows": total["rows"]}
+            for name, total in sorted(_totals.items())
+        }
+
+
+def to_json(spans=None):
+    return json.dumps({"run": span_rows(spans or []), "totals": snapshot()}, indent=2, default=str)
+
+
+def _label(name):
+    return name.replace("\\", "\\\\").replace('"', '\\"')
+
+
+def prometheus_text():
+    """Totals in the Prometheus text exposition format."""
+    with _lock:
+        totals = sorted((name, dict(total, buckets=list(total["buckets"])))
+                        for name, total in _totals.items())
+    lines = [
+        "# HELP sleep_span_seconds Duration of instrumented dashboard spans.",
+        "# TYPE sleep_span_seconds histogram",
+    ]
+    for name, total in totals:
+        label = _label(name)
+        cumulative = 0
+        for bound, count in zip(BUCKETS, total["buckets"]):
+            cumulative += count
+            lines.append(f'sleep_span_seconds_bucket{{span="{label}",le="{bound}"}} {cumulative}')
+        lines.append(f'sleep_span_seconds_bucket{{span="{label}",le="+Inf"}} {total["count"]}')
+        lines.append(f'sleep_span_seconds_sum{{span="{label}"}} {total["seconds"]:.6f}')
+        lines.append(f'sleep_span_seconds_count{{span="{label}"}} {total["count"]}')
+    lines += [
+        "# HELP sleep_span_rows_total Rows handled by instrumented dashboard spans.",
+        "# TYPE sleep_span_rows_total counter",
+    ]
+    lines += [f'sleep_span_rows_total{{span="{_label(name)}"}} {total["rows"]}'
+              for name, total in totals]
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,64 @@
+"""Compact columnar representation of sleep_log rows.
+
+Frames built here hold one fixed-width NumPy column per field instead of a
+Python object per cell:
+
+    id             int64
+    date           datetime64 (day precision; pandas stores it as [s])
+    sleep_sec      int32   seconds since midnight
+    wake_sec       int32   seconds since midnight
+    duration       float32 hours
+    sleep_quality  int8    1-5, UNRATED for rows logged before ratings existed
+    notes          object  text or None
+
+Analytics work on these columns directly, so nothing is formatted to a
+string and parsed back.
+"""
+import numpy as np
+import pandas as pd
+
+UNRATED = 0
+
+DTYPES = {
+    'id': np.int64,
+    'sleep_sec': np.int32,
+    'wake_sec': np.int32,
+    'duration': np.float32,
+    'sleep_quality': np.int8,
+}
+
+
+def from_rows(rows):
+    """Build a compact frame from ``(id, date, sleep_sec, wake_sec, duration, quality, notes)`` tuples."""
+    if not rows:
+        return empty()
+    ids, dates, sleep_sec, wake_sec, duration, quality, notes = zip(*rows)
+    return pd.DataFrame({
+        'id': np.array(ids, dtype=np.int64),
+        # str() covers both DATE objects (MySQL) and ISO strings (SQLite)
+        'date': np.array([str(d) for d in dates], dtype='datetime64[D]'),
+        'sleep_sec': np.array(sleep_sec, dtype=np.int32),
+        'wake_sec': np.array(wake_sec, dtype=np.int32),
+        'duration': np.array(duration, dtype=np.float32),
+        'sleep_quality': np.array([q or UNRATED for q in quality], dtype=np.int8),
+        'notes': np.array(notes, dtype=object),
+    })
+
+
+def empty():
+    frame = pd.DataFrame({name: np.array([], dtype=dtype) for name, dtype in DTYPES.items()})
+    frame.insert(1, 'date', np.array([], dtype='datetime64[D]'))
+    frame['notes'] = np.array([], dtype=object)
+    return frame
+
+
+def sleep_hour(frame):
+    """Hour of day (0-23) each night began, as a NumPy array."""
+    return frame['sleep_sec'].to_numpy() // 3600
+
+
+def weekday(frame):
+    """Monday=0 .. Sunday=6 as a NumPy array."""
+    days = frame['date'].to_numpy().astype('datetime64[D]').astype(np.int64)
+    # 1970-01-01 was a Thursday
+    return (days + 3) % 7
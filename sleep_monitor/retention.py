@@ -0,0 +1,133 @@
+"""Hot and archive tiers of sleep_log.
+
+Nights dated before the retention cutoff are moved from sleep_log into
+``sleep_log_archive`` (same columns and ids, ``duration_hours`` stored) so
+the hot table and its indexes stop growing with account age.  The cutoff
+only ever moves forward and is recorded in ``sleep_retention`` before any
+row moves.
+
+Readers select from ``union()``, which adds the archive to a query but
+bounds its branch by the cutoff: a window that starts after the cutoff is
+an empty index range on the archive, so recent windows only read hot rows.
+Per-month summaries live in ``sleep_rollup`` and are untouched by
+compaction, so the metrics stay complete without reading archived rows.
+
+    python -m sleep_monitor.retention --days 365
+"""
+import argparse
+import os
+import sys
+from datetime import date, timedelta
+
+from sleep_monitor import db, migrations
+
+HOT_DAYS = int(os.environ.get("SLEEP_HOT_DAYS", "365"))
+BATCH_SIZE = 5000
+
+ARCHIVE_TABLE = "sleep_log_archive"
+
+COLUMNS = ['id', 'user_id', 'date', 'sleep_time', 'wake_time', 'sleep_quality', 'notes',
+           'created_at', 'duration_hours']
+
+# Archived nights are all dated before the cutoff; no row here means nothing is archived
+_CUTOFF = "(SELECT cutoff FROM sleep_retention WHERE id = 1)"
+
+
+def create_tables(cursor):
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {ARCHIVE_TABLE} (
+            id INT PRIMARY KEY,
+            user_id INT NOT NULL,
+            date DATE NOT NULL,
+            sleep_time TIME NOT NULL,
+            wake_time TIME NOT NULL,
+            sleep_quality INT,
+            notes TEXT,
+            created_at TIMESTAMP NULL,
+            duration_hours DOUBLE NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+    """)
+    backend = db.get_backend()
+    if not backend.index_exists(cursor, ARCHIVE_TABLE, "idx_sleep_log_archive_user_date"):
+        cursor.execute(f"CREATE INDEX idx_sleep_log_archive_user_date ON {ARCHIVE_TABLE} (user_id, date)")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS sleep_retention (
+            id INT PRIMARY KEY,
+            cutoff DATE NOT NULL
+        )
+    """)
+
+
+def union(columns, where, archive_where=None):
+    """Derived table ``tiers`` of ``columns`` from both tiers where ``where`` holds.
+
+    The condition's parameters appear once per tier, so pass them twice.
+    ``archive_where`` replaces it for the archive branch when the two differ.
+    """
+    return (f"(SELECT {columns} FROM sleep_log WHERE {where} "
+            f"UNION ALL SELECT {columns} FROM {ARCHIVE_TABLE} "
+            f"WHERE {archive_where or where} AND date < {_CUTOFF}) tiers")
+
+
+def tiers(columns, where, archive=True):
+    """``(derived table, parameter copies)``: ``union()``, or sleep_log alone.
+
+    Migrations that run before the archive exists pass ``archive=False``.
+    """
+    if not archive:
+        return f"(SELECT {columns} FROM sleep_log WHERE {where}) tiers", 1
+    return union(columns, where), 2
+
+
+def cutoff():
+    """Nights dated before this may be archived; None before the first compaction."""
+    with db.cursor() as cursor:
+        cursor.execute("SELECT cutoff FROM sleep_retention WHERE id = 1")
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    return date.fromisoformat(row[0]) if isinstance(row[0], str) else row[0]
+
+
+def compact(days=HOT_DAYS, batch_size=BATCH_SIZE, today=None):
+    """Move nights older than ``days`` into the archive; returns how many moved."""
+    backend = db.get_backend()
+    new_cutoff = (today or date.today()) - timedelta(days=days)
+    current = cutoff()
+    if current is not None and current >= new_cutoff:
+        new_cutoff = current
+    # Readers must look in the archive before any row arrives there
+    with db.cursor(commit=True) as cursor:
+        cursor.execute(db.sql(backend.upsert("sleep_retention", ["id", "cutoff"], ["id"])), (1, new_cutoff))
+        cursor.execute("SELECT COALESCE(MIN(id), 0), COALESCE(MAX(id), -1) FROM sleep_log")
+        first, last = cursor.fetchone()
+    columns = ", ".join(COLUMNS)
+    moved = 0
+    # Primary-key ranges, one transaction each, so no batch rescans the table
+    for start in range(first, last + 1, batch_size):
+        params = (start, start + batch_size - 1, new_cutoff)
+        where = "id BETWEEN %s AND %s AND date < %s"
+        with db.cursor(commit=True) as cursor:
+            cursor.execute(db.sql(f"INSERT INTO {ARCHIVE_TABLE} ({columns}) "
+                                  f"SELECT {columns} FROM sleep_log WHERE {where}"), params)
+            cursor.execute(db.sql(f"DELETE FROM sleep_log WHERE {where}"), params)
+            moved += cursor.rowcount
+    return moved
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Move old sleep_log nights into the archive tier.")
+    parser.add_argument("--days", type=int, default=HOT_DAYS,
+                        help="nights newer than this many days stay hot (default: SLEEP_HOT_DAYS or 365)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    migrations.ensure_schema()
+    moved = compact(args.days, args.batch_size)
+    print(f"{moved} nights archived", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,217 @@
+"""Rolling averages, rolling spread and cumulative sleep debt.
+
+Nights are folded into per-day totals.  Each rolling window keeps its last
+``days`` daily totals in a ring buffer together with a Welford mean and sum
+of squared deviations, so a new day is added (and the day that slides out
+evicted) in constant time.  Sleep debt accumulates ``TARGET_HOURS`` minus
+each logged day's total, the same target ``efficiency`` is measured against.
+
+The engine for a user is cached and extended with just the nights added
+since it was built, fetched by id so neither the full history nor the
+series is touched again; a night dated before the newest one triggers a
+replay.  The series lives in a preallocated array that doubles when full,
+and ``window()`` binary-searches it by date, so a new night costs the same
+however long the history is.  Edits and deletions made elsewhere are picked
+up when ``loader.revalidate`` expires the cached engine.
+"""
+import copy
+import threading
+
+import numpy as np
+import pandas as pd
+
+from sleep_monitor import loader, profiling, write_queue
+from sleep_monitor.cache import user_cache
+from sleep_monitor.metrics import TARGET_HOURS
+
+WINDOWS = (7, 30)
+
+_lock = threading.Lock()
+
+
+class RollingWindow:
+    """Mean and sample std of the daily totals in the last ``days`` calendar days."""
+
+    __slots__ = ("days", "_slots", "_last", "n", "mean", "_m2")
+
+    def __init__(self, days):
+        self.days = days
+        self._slots = [None] * days
+        self._last = None
+        self.n = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def _add(self, x):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self._m2 += delta * (x - self.mean)
+
+    def _remove(self, x):
+        if self.n == 1:
+            self.n, self.mean, self._m2 = 0, 0.0, 0.0
+            return
+        self.n -= 1
+        delta = x - self.mean
+        self.mean -= delta / self.n
+        self._m2 = max(self._m2 - delta * (x - self.mean), 0.0)
+
+    def push(self, day, hours):
+        """Add ``hours`` to day number ``day``; days must not go backwards."""
+        if self._last is not None:
+            if day < self._last:
+                raise ValueError("days must be pushed in order")
+            # Evict the days that slide out; never more than one pass over the ring
+            for expired in range(max(self._last + 1, day - self.days + 1), day + 1):
+                slot = expired % self.days
+                if self._slots[slot] is not None:
+                    self._remove(self._slots[slot])
+                    self._slots[slot] = None
+        slot = day % self.days
+        total = hours
+        if self._slots[slot] is not None:
+            # Another entry for the same day replaces its total
+            self._remove(self._slots[slot])
+            total += self._slots[slot]
+        self._slots[slot] = total
+        self._add(total)
+        self._last = day
+
+    @property
+    def std(self):
+        return np.sqrt(self._m2 / (self.n - 1)) if self.n > 1 else np.nan
+
+
+class SleepTrends:
+    """Per-day series of rolling statistics and sleep debt, extended night by night."""
+
+    INITIAL_CAPACITY = 64
+
+    def __init__(self, target=TARGET_HOURS):
+        self.target = target
+        self.windows = [RollingWindow(days) for days in WINDOWS]
+        self.debt = 0.0
+        self.nights = 0
+        self.watermark = 0
+        # One row per day, one column per ``columns()`` entry; rows past _size are unused
+        self._data = np.empty((self.INITIAL_CAPACITY, len(self.columns())))
+        self._size = 0
+
+    @staticmethod
+    def columns():
+        names = ['day', 'hours']
+        for days in WINDOWS:
+            names += [f'avg_{days}', f'std_{days}']
+        return names + ['debt']
+
+    @property
+    def last_day(self):
+        return int(self._data[self._size - 1, 0]) if self._size else None
+
+    def __len__(self):
+        return self._size
+
+    def add(self, day, hours, row_id=0):
+        """Fold one night into day number ``day`` (days since 1970-01-01)."""
+        same_day = day == self.last_day
+        # A second entry for a day reduces that day's shortfall by its hours
+        self.debt += -hours if same_day else self.target - hours
+        for window in self.windows:
+            window.push(day, hours)
+        values = [day, self._data[self._size - 1, 1] + hours if same_day else hours]
+        for window in self.windows:
+            values += [window.mean, window.std]
+        values.append(self.debt)
+        if same_day:
+            self._data[self._size - 1] = values
+        else:
+            if self._size == len(self._data):
+                # Doubling keeps appends amortised O(1); readers may still hold the old array
+                self._data = np.concatenate([self._data, np.empty_like(self._data)])
+            self._data[self._size] = values
+            self._size += 1
+        self.nights += 1
+        self.watermark = max(self.watermark, row_id)
+
+    def extend(self, df):
+        """Add the nights in ``df``; False if one is older than the newest day."""
+        if df.empty:
+            return True
+        df = df.sort_values(['date', 'id'])
+        days = df['date'].to_numpy().astype('datetime64[D]').astype(np.int64)
+        if self.last_day is not None and days[0] < self.last_day:
+            return False
+        for day, hours, row_id in zip(days.tolist(), df['duration'].tolist(), df['id'].tolist()):
+            self.add(day, hours, row_id)
+        return True
+
+    @classmethod
+    def from_frame(cls, df):
+        trends = cls()
+        trends.extend(df)
+        return trends
+
+    def copy(self):
+        return copy.deepcopy(self)
+
+    def frame(self, start=None, end=None):
+        """Days numbered ``start``..``end`` (all when omitted) as a frame, oldest first."""
+        # Size before data: a concurrent add may grow the array, never shrink what is filled
+        size = self._size
+        data = self._data[:size]
+        lo, hi = 0, size
+        if start is not None:
+            lo = int(np.searchsorted(data[:, 0], start, side='left'))
+            hi = int(np.searchsorted(data[:, 0], end, side='right'))
+        rows = data[lo:hi].copy()
+        frame = pd.DataFrame(rows[:, 1:], columns=self.columns()[1:])
+        frame.insert(0, 'date', rows[:, 0].astype(np.int64).astype('datetime64[D]'))
+        return frame
+
+    def __sizeof__(self):
+        return object.__sizeof__(self) + self._data.nbytes
+
+
+def load_trends(user_id):
+    """The user's ``SleepTrends``, extended with the nights added since it was last read."""
+    loader.revalidate(user_id)
+    trends = user_cache.get(user_id, "trends")
+    if trends is None:
+        version = user_cache.version(user_id)
+        with _lock:
+            stale = user_cache.peek(user_id, "trends")
+            trends = stale[1] if stale else None
+            with profiling.span("rolling.extend") as span:
+                new = loader.load_after(user_id, trends.watermark if trends else 0)
+                if trends is None:
+                    trends = SleepTrends.from_frame(new)
+                elif not trends.extend(new):
+                    # A backdated entry needs a replay from the start
+                    new = loader.load_after(user_id)
+                    trends = SleepTrends.from_frame(new)
+                span.tag(rows=len(new))
+        user_cache.put(user_id, "trends", trends, version=version)
+    if write_queue.enabled():
+        trends = _with_pending(trends, user_id)
+    return trends
+
+
+def _with_pending(trends, user_id):
+    # Queued submissions go into a copy; the cached engine only takes flushed rows
+    pending = write_queue.pending_frame(user_id)
+    if pending.empty:
+        return trends
+    merged = trends.copy()
+    if not merged.extend(pending):
+        merged = SleepTrends.from_frame(pd.concat([loader.load_after(user_id), pending], ignore_index=True))
+    return merged
+
+
+def _day(value):
+    return int(np.datetime64(pd.Timestamp(value).date(), 'D').astype(np.int64))
+
+
+def window(trends, start, end):
+    """Rows of ``trends`` dated ``start``..``end`` as a frame, found by binary search."""
+    return trends.frame(_day(start), _day(end))
@@ -0,0 +1,247 @@
+"""Per-user rollups of sleep_log at day, ISO-week and month grain.
+
+Each ``sleep_rollup`` row holds the sufficient statistics of one period:
+night and rating counts, sums and sums of squares of duration, bedtime hour
+and quality, per-rating counts and per-weekday nights and hours.  Every
+insert into sleep_log adds its deltas to the three periods it falls in, in
+the same transaction, so the totals for any date range can be summed from
+a few month, week and day rows instead of scanning raw nights.
+
+After editing sleep_log by hand, recompute with
+
+    python -m sleep_monitor.rollups [--user-id 1]
+"""
+import argparse
+import sys
+from datetime import time, timedelta
+
+import numpy as np
+import pandas as pd
+
+from sleep_monitor import db, migrations, records, retention
+
+GRAINS = ("day", "week", "month")
+
+COUNT_COLUMNS = (['nights', 'rated'] + [f'q{k}' for k in range(1, 6)]
+                 + [f'wd{d}_nights' for d in range(7)])
+SUM_COLUMNS = (['duration_sum', 'duration_sq', 'hour_sum', 'hour_sq', 'quality_sum', 'quality_sq']
+               + [f'wd{d}_hours' for d in range(7)])
+STATS = COUNT_COLUMNS + SUM_COLUMNS
+COLUMNS = ['user_id', 'grain', 'period_start'] + STATS
+
+
+def create_table(cursor):
+    counts = ",\n".join(f"            {col} INT NOT NULL DEFAULT 0" for col in COUNT_COLUMNS)
+    sums = ",\n".join(f"            {col} DOUBLE NOT NULL DEFAULT 0" for col in SUM_COLUMNS)
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS sleep_rollup (
+            user_id INT NOT NULL,
+            grain VARCHAR(5) NOT NULL,
+            period_start DATE NOT NULL,
+{counts},
+{sums},
+            PRIMARY KEY (user_id, grain, period_start),
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+    """)
+
+
+# Deltas
+def _period_starts(days, grain):
+    if grain == "day":
+        return days
+    if grain == "week":
+        # 1970-01-01 was a Thursday; step back to the Monday
+        return days - (days.astype(np.int64) + 3) % 7
+    return days.astype('datetime64[M]').astype('datetime64[D]')
+
+
+def as_seconds(value):
+    """Seconds after midnight of a TIME value, however the driver returned it."""
+    if isinstance(value, str):
+        value = time.fromisoformat(value)
+    elif isinstance(value, timedelta):
+        # MySQL returns TIME columns as timedelta
+        return int(value.total_seconds())
+    return value.hour * 3600 + value.minute * 60 + value.second
+
+
+def _stat_frame(user_ids, days, sleep_sec, duration, quality):
+    weekday = (days.astype(np.int64) + 3) % 7
+    hour = (sleep_sec // 3600).astype(np.float64)
+    q = quality.astype(np.float64)
+    columns = {
+        'user_id': user_ids,
+        'nights': np.ones(len(days), dtype=np.int64),
+        'rated': (quality != records.UNRATED).astype(np.int64),
+    }
+    for k in range(1, 6):
+        columns[f'q{k}'] = (quality == k).astype(np.int64)
+    for d in range(7):
+        columns[f'wd{d}_nights'] = (weekday == d).astype(np.int64)
+    columns.update(duration_sum=duration, duration_sq=duration * duration,
+                   hour_sum=hour, hour_sq=hour * hour, quality_sum=q, quality_sq=q * q)
+    for d in range(7):
+        columns[f'wd{d}_hours'] = np.where(weekday == d, duration, 0.0)
+    return pd.DataFrame(columns)
+
+
+def deltas(user_ids, days, sleep_sec, duration, quality):
+    """Upsert parameters adding these nights to every grain's periods."""
+    frame = _stat_frame(user_ids, days, sleep_sec, duration, quality)
+    params = []
+    for grain in GRAINS:
+        grouped = frame.groupby([frame['user_id'], _period_starts(days, grain)], sort=False)
+        counts = grouped[COUNT_COLUMNS].sum()
+        sums = grouped[SUM_COLUMNS].sum()
+        for (user_id, start), count_row, sum_row in zip(counts.index, counts.to_numpy().tolist(),
+                                                       sums.to_numpy().tolist()):
+            params.append((int(user_id), grain, start.date(), *count_row, *sum_row))
+    return params
+
+
+def _apply(cursor, params):
+    if params:
+        backend = db.get_backend()
+        cursor.executemany(db.sql(backend.upsert("sleep_rollup", COLUMNS, COLUMNS[:3], increment=True)),
+                           params)
+
+
+def add(cursor, rows):
+    """Add new nights' deltas to their day, week and month rows.
+
+    ``rows`` are ``writes.INSERT_SLEEP_LOG`` parameters; the caller commits.
+    """
+    if not rows:
+        return
+    user_ids, dates, sleep_times, wake_times, qualities, _ = zip(*rows)
+    sleep_sec = np.array([as_seconds(value) for value in sleep_times], dtype=np.int64)
+    wake_sec = np.array([as_seconds(value) for value in wake_times], dtype=np.int64)
+    # Same rule as the duration_hours column: a wake time before bedtime is the next day
+    duration = ((wake_sec - sleep_sec) % 86400) / 3600.0
+    _apply(cursor, deltas(
+        np.array(user_ids, dtype=np.int64),
+        np.array([str(d)[:10] for d in dates], dtype='datetime64[D]'),
+        sleep_sec,
+        duration,
+        np.array([q or records.UNRATED for q in qualities], dtype=np.int64),
+    ))
+
+
+def rebuild(cursor, user_ids=None, archive=True):
+    """Recompute rollups from sleep_log, for every user or just ``user_ids``.
+
+    Migration 6 passes ``archive=False``, as sleep_log_archive comes later.
+    """
+    backend = db.get_backend()
+    if user_ids is None:
+        cursor.execute("DELETE FROM sleep_rollup")
+        cursor.execute(f"SELECT DISTINCT user_id FROM {retention.tiers('user_id', '1 = 1', archive)[0]}")
+        user_ids = [row[0] for row in cursor.fetchall()]
+    else:
+        cursor.executemany(db.sql("DELETE FROM sleep_rollup WHERE user_id = %s"),
+                           [(user_id,) for user_id in user_ids])
+    columns = f"date, {backend.time_to_sec('sleep_time')} AS sleep_sec, duration_hours, sleep_quality"
+    source, copies = retention.tiers(columns, 'user_id = %s', archive)
+    query = db.sql(f"SELECT * FROM {source}")
+    for user_id in user_ids:
+        # One user's history at a time keeps memory bounded
+        cursor.execute(query, (user_id,) * copies)
+        rows = cursor.fetchall()
+        if not rows:
+            continue
+        dates, sleep_sec, duration, quality = zip(*rows)
+        _apply(cursor, deltas(
+            np.full(len(rows), user_id, dtype=np.int64),
+            np.array([str(d) for d in dates], dtype='datetime64[D]'),
+            np.array(sleep_sec, dtype=np.int64),
+            np.array(duration, dtype=np.float64),
+            np.array([q or records.UNRATED for q in quality], dtype=np.int64),
+        ))
+
+
+# Range totals
+def _month_start(day):
+    return day.replace(day=1)
+
+
+def _next_month(day):
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def _cover_weeks(start, end):
+    first_week = start + timedelta(days=-start.weekday() % 7)
+    last_week = end - timedelta(days=(end.weekday() + 1) % 7) - timedelta(days=6)
+    if first_week > last_week:
+        return [("day", start, end)]
+    pieces = [("week", first_week, last_week)]
+    if start < first_week:
+        pieces.append(("day", start, first_week - timedelta(days=1)))
+    if last_week + timedelta(days=6) < end:
+        pieces.append(("day", last_week + timedelta(days=7), end))
+    return pieces
+
+
+def cover(start, end):
+    """``(grain, first_period, last_period)`` pieces that tile ``start``..``end`` exactly."""
+    first_month = start if start.day == 1 else _next_month(start)
+    after_last = _next_month(end) if _next_month(end) - timedelta(days=1) == end else _month_start(end)
+    if first_month >= after_last:
+        return _cover_weeks(start, end)
+    last_month = _month_start(after_last - timedelta(days=1))
+    pieces = [("month", first_month, last_month)]
+    if start < first_month:
+        pieces += _cover_weeks(start, first_month - timedelta(days=1))
+    if after_last <= end:
+        pieces += _cover_weeks(after_last, end)
+    return pieces
+
+
+def range_totals(user_id, start=None, end=None):
+    """Sufficient statistics for the user's nights in ``start``..``end`` (all time when omitted).
+
+    Returns the dict ``metrics.from_totals`` expects.
+    """
+    if start is None or end is None:
+        pieces = [("month", "0001-01-01", "9999-12-31")]
+    else:
+        pieces = cover(start, end)
+    # One primary-key range scan per piece; an OR of them would scan every row of the user
+    branch = f"SELECT {', '.join(STATS)} FROM sleep_rollup " \
+             "WHERE user_id = %s AND grain = %s AND period_start BETWEEN %s AND %s"
+    with db.cursor() as cursor:
+        cursor.execute(
+            db.sql(f"SELECT {', '.join(f'SUM({col})' for col in STATS)} "
+                   f"FROM ({' UNION ALL '.join([branch] * len(pieces))}) pieces"),
+            [value for piece in pieces for value in (user_id, *piece)],
+        )
+        values = dict(zip(STATS, (value or 0 for value in cursor.fetchone())))
+    return {
+        'nights': int(values['nights']),
+        'rated': int(values['rated']),
+        'duration_sum': float(values['duration_sum']),
+        'duration_sq': float(values['duration_sq']),
+        'hour_sum': float(values['hour_sum']),
+        'hour_sq': float(values['hour_sq']),
+        'quality_sum': float(values['quality_sum']),
+        'quality_sq': float(values['quality_sq']),
+        'quality_counts': np.array([values[f'q{k}'] for k in range(1, 6)], dtype=np.int64),
+        'weekday_nights': np.array([values[f'wd{d}_nights'] for d in range(7)], dtype=np.int64),
+        'weekday_hours': np.array([values[f'wd{d}_hours'] for d in range(7)], dtype=np.float64),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recompute sleep_rollup from sleep_log.")
+    parser.add_argument("--user-id", type=int, action="append",
+                        help="only this user (repeatable); all users by default")
+    args = parser.parse_args(argv)
+
+    migrations.ensure_schema()
+    with db.cursor(commit=True) as cursor:
+        rebuild(cursor, args.user_id)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
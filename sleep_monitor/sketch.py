@@ -0,0 +1,107 @@
+"""Mergeable quantile sketch (merging t-digest).
+
+A digest summarises any number of values in at most ``compression + 1``
+weighted centroids, finer towards the tails where percentiles change fastest.
+Digests built over separate chunks merge into the digest of the union, and
+rank and quantile queries cost the same however many values went in.
+"""
+import json
+
+import numpy as np
+
+DEFAULT_COMPRESSION = 100
+
+# Values are buffered and folded into the centroids this many at a time
+BUFFER_FACTOR = 10
+
+
+class TDigest:
+    def __init__(self, compression=DEFAULT_COMPRESSION):
+        self.compression = compression
+        self.means = np.empty(0, dtype=np.float64)
+        self.weights = np.empty(0, dtype=np.float64)
+        self.min = np.inf
+        self.max = -np.inf
+        self._buffer = []
+
+    @property
+    def count(self):
+        self._flush()
+        return float(self.weights.sum())
+
+    def update(self, values, weights=None):
+        """Add ``values`` (with optional per-value ``weights``)."""
+        values = np.asarray(values, dtype=np.float64).ravel()
+        if not len(values):
+            return
+        weights = np.ones(len(values)) if weights is None else np.asarray(weights, dtype=np.float64)
+        self._buffer.append((values, weights))
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        if sum(len(chunk) for chunk, _ in self._buffer) > BUFFER_FACTOR * self.compression:
+            self._flush()
+
+    def merge(self, other):
+        """Fold ``other`` into this digest; the result summarises both."""
+        other._flush()
+        if len(other.means):
+            self._buffer.append((other.means, other.weights))
+            self.min = min(self.min, other.min)
+            self.max = max(self.max, other.max)
+            self._flush()
+        return self
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        means = np.concatenate([self.means] + [values for values, _ in self._buffer])
+        weights = np.concatenate([self.weights] + [w for _, w in self._buffer])
+        self._buffer = []
+        order = np.argsort(means, kind='stable')
+        means, weights = means[order], weights[order]
+        total = weights.sum()
+        # k1 scale: a centroid may span one unit of k, which is narrow near q=0 and q=1
+        q = (np.cumsum(weights) - weights / 2) / total
+        k = np.floor(self.compression * (np.arcsin(2 * q - 1) / np.pi + 0.5))
+        starts = np.flatnonzero(np.r_[True, k[1:] != k[:-1]])
+        self.weights = np.add.reduceat(weights, starts)
+        self.means = np.add.reduceat(means * weights, starts) / self.weights
+
+    def rank(self, x):
+        """Estimated total weight of the values below ``x``."""
+        self._flush()
+        if not len(self.means):
+            return 0.0
+        cumulative = np.cumsum(self.weights)
+        lo, hi = np.searchsorted(self.means, x, 'left'), np.searchsorted(self.means, x, 'right')
+        if hi > lo:
+            # Ties (say many averages of exactly 3.0) count half, as a mid-rank
+            below = cumulative[lo - 1] if lo else 0.0
+            return float(below + (cumulative[hi - 1] - below) / 2)
+        centers = cumulative - self.weights / 2
+        return float(np.interp(x, np.r_[self.min, self.means, self.max],
+                               np.r_[0.0, centers, self.weights.sum()]))
+
+    def quantile(self, q):
+        self._flush()
+        if not len(self.means):
+            return np.nan
+        centers = np.cumsum(self.weights) - self.weights / 2
+        total = self.weights.sum()
+        return float(np.interp(q * total, np.r_[0.0, centers, total],
+                               np.r_[self.min, self.means, self.max]))
+
+    def to_json(self):
+        self._flush()
+        return json.dumps({"compression": self.compression, "min": self.min, "max": self.max,
+                           "means": self.means.tolist(), "weights": self.weights.tolist()})
+
+    @classmethod
+    def from_json(cls, text):
+        state = json.loads(text)
+        digest = cls(state["compression"])
+        digest.means = np.array(state["means"], dtype=np.float64)
+        digest.weights = np.array(state["weights"], dtype=np.float64)
+        if len(digest.means):
+            digest.min, digest.max = state["min"], state["max"]
+        return digest
@@ -0,0 +1,129 @@
+"""The dashboard stylesheet.
+
+Text uses the system UI font, so nothing is fetched from a CDN or served
+by the app.
+"""
+import re
+
+CUSTOM_CSS = """
+/* Main theme colors */
+:root {
+    --primary-100: #1F3A5F;
+    --primary-200: #4d648d;
+    --primary-300: #acc2ef;
+    --accent-100: #3D5A80;
+    --accent-200: #cee8ff;
+    --text-100: #FFFFFF;
+    --text-200: #e0e0e0;
+    --bg-100: #0F1C2E;
+    --bg-200: #1f2b3e;
+    --bg-300: #374357;
+}
+
+/* Global styles */
+* {
+    font-family: system-ui, -apple-system, 'Segoe UI', Roboto, sans-serif;
+}
+
+/* Main container */
+.main {
+    background-color: var(--bg-100);
+    color: var(--text-100);
+}
+
+/* Cards */
+.card {
+    background-color: var(--bg-200);
+    border-radius: 15px;
+    padding: 20px;
+    margin: 10px 0;
+    border: 1px solid var(--primary-200);
+    box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1);
+}
+
+/* Headers */
+h1, h2, h3 {
+    color: var(--text-100) !important;
+    font-weight: 600 !important;
+    margin-bottom: 1rem !important;
+}
+
+/* Metrics */
+.stMetric {
+    background-color: var(--bg-200);
+    padding: 1.5rem;
+    border-radius: 15px;
+    border: 1px solid var(--primary-200);
+    box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1);
+}
+
+/* Buttons */
+.stButton>button {
+    background-color: var(--primary-200);
+    color: var(--text-100);
+    border: none;
+    padding: 0.7rem 1.5rem;
+    border-radius: 8px;
+    font-weight: 500;
+    transition: all 0.3s ease;
+}
+
+.stButton>button:hover {
+    background-color: var(--primary-100);
+    transform: translateY(-2px);
+}
+
+/* Input fields */
+.stTextInput>div>div>input {
+    background-color: var(--bg-300);
+    color: var(--text-100);
+    border: 1px solid var(--primary-200);
+    border-radius: 8px;
+    padding: 0.5rem;
+}
+
+/* Slider */
+.stSlider>div>div>div {
+    background-color: var(--primary-200);
+}
+
+/* Plotly charts */
+.js-plotly-plot {
+    background-color: var(--bg-200) !important;
+    border-radius: 15px;
+    padding: 10px;
+}
+
+/* Success and error messages */
+.stSuccess {
+    background-color: rgba(0, 255, 0, 0.1);
+    border: 1px solid #00ff00;
+    border-radius: 8px;
+    padding: 1rem;
+}
+
+.stError {
+    background-color: rgba(255, 0, 0, 0.1);
+    border: 1px solid #ff0000;
+    border-radius: 8px;
+    padding: 1rem;
+}
+
+/* Custom container for sleep entry */
+.sleep-entry {
+    background-color: var(--bg-200);
+    border-radius: 15px;
+    padding: 20px;
+    margin: 20px 0;
+    border: 1px solid var(--primary-200);
+}
+"""
+
+
+def _minify(css):
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    return re.sub(r"\s*([{};,>])\s*", r"\1", re.sub(r"\s+", " ", css)).strip()
+
+
+# Built once per server process; the app script itself re-runs on every interaction
+STYLE = f"<style>{_minify(CUSTOM_CSS)}</style>"
@@ -0,0 +1,29 @@
+"""Rules for a valid sleep log entry, shared by the form and the importer."""
+from datetime import date, datetime, timedelta
+
+
+# Calculate sleep duration
+def calculate_sleep_duration(sleep_time, wake_time):
+    sleep_dt = datetime.combine(date.today(), sleep_time)
+    wake_dt = datetime.combine(date.today(), wake_time)
+
+    if wake_dt < sleep_dt:
+        wake_dt += timedelta(days=1)
+
+    duration = wake_dt - sleep_dt
+    return duration.total_seconds() / 3600  # Convert to hours
+
+
+def validate_entry(sleep_time, wake_time, sleep_quality):
+    """Return ``(duration, error)``; ``error`` is None for a valid entry."""
+    duration = calculate_sleep_duration(sleep_time, wake_time)
+
+    if duration <= 0:
+        return duration, "Wake time must be after sleep time!"
+    if duration > 24:
+        return duration, "Sleep duration cannot be more than 24 hours!"
+    if duration < 1:
+        return duration, "Sleep duration seems too short. Please check your times."
+    if not 1 <= sleep_quality <= 5:
+        return duration, "Sleep quality must be between 1 and 5."
+    return duration, None
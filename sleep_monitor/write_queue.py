@@ -0,0 +1,208 @@
+"""Optional write-behind queue for sleep log submissions.
+
+With ``SLEEP_WRITE_BEHIND=1`` a submission is committed to a local SQLite
+journal (``SLEEP_WRITE_QUEUE_PATH``) and returns at once.  A background
+worker drains the journal into sleep_log in batched transactions.  Until
+then the loader merges the user's pending rows into what the dashboard
+shows.
+
+A flush claims its batch in the journal and commits before it touches the
+database, so submissions never wait on the remote transaction.  Each row
+carries an idempotency key, the journal's name plus the row id, recorded in
+``write_queue_applied`` in the same transaction as the sleep_log insert: a
+batch replayed after a crash, or re-claimed after ``CLAIM_TIMEOUT``, skips
+the rows that already landed.
+"""
+import os
+import sqlite3
+import threading
+import time as _time
+import uuid
+from datetime import time
+
+from sleep_monitor import db
+from sleep_monitor.cache import user_cache
+from sleep_monitor.validation import calculate_sleep_duration
+
+JOURNAL_PATH = os.environ.get("SLEEP_WRITE_QUEUE_PATH", "sleep_write_queue.db")
+BATCH_SIZE = 500
+FLUSH_INTERVAL = float(os.environ.get("SLEEP_WRITE_FLUSH_SECONDS", "1.0"))
+MAX_BACKOFF = 60.0
+
+# A claim older than this belongs to a worker that died mid-flush
+CLAIM_TIMEOUT = 300.0
+
+stats = {"enqueued": 0, "flushed": 0, "batches": 0, "failures": 0}
+
+_lock = threading.Lock()
+_worker = None
+
+
+def enabled():
+    return os.environ.get("SLEEP_WRITE_BEHIND", "0") == "1"
+
+
+def _journal():
+    conn = sqlite3.connect(JOURNAL_PATH, timeout=30, isolation_level=None,
+                           check_same_thread=False)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = FULL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS pending (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            sleep_time TEXT NOT NULL,
+            wake_time TEXT NOT NULL,
+            sleep_quality INTEGER,
+            notes TEXT,
+            claimed_at REAL
+        )
+    """)
+    # Journals written before claims existed
+    if "claimed_at" not in {row[1] for row in conn.execute("PRAGMA table_info(pending)")}:
+        conn.execute("ALTER TABLE pending ADD COLUMN claimed_at REAL")
+    conn.execute("CREATE TABLE IF NOT EXISTS journal (id INTEGER PRIMARY KEY CHECK (id = 1), name TEXT NOT NULL)")
+    return conn
+
+
+def _journal_name(conn):
+    """This journal file's random name, the first half of every idempotency key."""
+    conn.execute("INSERT OR IGNORE INTO journal (id, name) VALUES (1, ?)", (uuid.uuid4().hex,))
+    return conn.execute("SELECT name FROM journal WHERE id = 1").fetchone()[0]
+
+
+def enqueue(user_id, log_date, sleep_time, wake_time, sleep_quality, notes):
+    """Durably queue one submission and make sure the worker is running."""
+    conn = _journal()
+    try:
+        conn.execute(
+            "INSERT INTO pending (user_id, date, sleep_time, wake_time, sleep_quality, notes) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (user_id, log_date.isoformat(), sleep_time.strftime("%H:%M:%S"),
+             wake_time.strftime("%H:%M:%S"), sleep_quality, notes),
+        )
+    finally:
+        conn.close()
+    stats["enqueued"] += 1
+    user_cache.bump(user_id)
+    start()
+
+
+def pending_frame(user_id):
+    """The user's queued rows as a compact frame (ids are negative)."""
+    # records and rollups pull in pandas; the login page only starts the worker
+    from sleep_monitor import records
+    if not os.path.exists(JOURNAL_PATH):
+        return records.empty()
+    conn = _journal()
+    try:
+        rows = conn.execute(
+            "SELECT id, date, sleep_time, wake_time, sleep_quality, notes "
+            "FROM pending WHERE user_id = ? ORDER BY id", (user_id,)
+        ).fetchall()
+    finally:
+        conn.close()
+    converted = []
+    for journal_id, log_date, sleep_text, wake_text, quality, notes in rows:
+        sleep_time = time.fromisoformat(sleep_text)
+        wake_time = time.fromisoformat(wake_text)
+        converted.append((-journal_id, log_date, _seconds(sleep_time), _seconds(wake_time),
+                          calculate_sleep_duration(sleep_time, wake_time), quality, notes))
+    return records.from_rows(converted)
+
+
+def _seconds(value):
+    return value.hour * 3600 + value.minute * 60 + value.second
+
+
+def _claim(conn, batch_size):
+    """Mark up to ``batch_size`` unclaimed rows as ours and commit straight away.
+
+    Returns the journal name, the lowest id still queued and the rows.
+    """
+    # IMMEDIATE keeps other processes' workers off the same rows, but only for the claim
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        name = _journal_name(conn)
+        now = _time.time()
+        rows = conn.execute(
+            "SELECT id, user_id, date, sleep_time, wake_time, sleep_quality, notes FROM pending "
+            "WHERE claimed_at IS NULL OR claimed_at < ? ORDER BY id LIMIT ?",
+            (now - CLAIM_TIMEOUT, batch_size),
+        ).fetchall()
+        conn.executemany("UPDATE pending SET claimed_at = ? WHERE id = ?", [(now, row[0]) for row in rows])
+        oldest = conn.execute("SELECT MIN(id) FROM pending").fetchone()[0]
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return name, oldest, rows
+
+
+def _apply(cursor, name, oldest, rows):
+    """Insert the rows whose keys are not in write_queue_applied yet, and record them."""
+    from sleep_monitor.writes import insert_nights
+    # Keys below the oldest queued id can never be replayed again
+    cursor.execute(db.sql("DELETE FROM write_queue_applied WHERE journal = %s AND entry_id < %s"),
+                   (name, oldest))
+    ids = [row[0] for row in rows]
+    cursor.execute(db.sql(f"SELECT entry_id FROM write_queue_applied WHERE journal = %s "
+                          f"AND entry_id IN ({', '.join(['%s'] * len(ids))})"), [name, *ids])
+    applied = {row[0] for row in cursor.fetchall()}
+    fresh = [row[1:] for row in rows if row[0] not in applied]
+    # A concurrent replay of the same keys fails here on the primary key and rolls back
+    cursor.executemany(db.sql("INSERT INTO write_queue_applied (journal, entry_id) VALUES (%s, %s)"),
+                       [(name, row[0]) for row in rows if row[0] not in applied])
+    insert_nights(cursor, fresh)
+    return len(fresh)
+
+
+def flush(batch_size=BATCH_SIZE):
+    """Move up to ``batch_size`` queued rows into sleep_log; returns how many were taken."""
+    conn = _journal()
+    try:
+        name, oldest, rows = _claim(conn, batch_size)
+        if not rows:
+            return 0
+        ids = [(row[0],) for row in rows]
+        try:
+            with db.cursor(commit=True) as cursor:
+                inserted = _apply(cursor, name, oldest, rows)
+        except BaseException:
+            # Let the next flush retry at once instead of waiting out the claim
+            conn.executemany("UPDATE pending SET claimed_at = NULL WHERE id = ?", ids)
+            raise
+        conn.executemany("DELETE FROM pending WHERE id = ?", ids)
+    finally:
+        conn.close()
+    stats["flushed"] += inserted
+    stats["batches"] += 1
+    for user_id in {row[1] for row in rows}:
+        user_cache.bump(user_id)
+    return len(rows)
+
+
+def _run():
+    # Submissions accumulate between wakeups and are flushed together
+    backoff = FLUSH_INTERVAL
+    while True:
+        _time.sleep(backoff)
+        try:
+            while flush() == BATCH_SIZE:
+                pass
+            backoff = FLUSH_INTERVAL
+        except Exception:
+            stats["failures"] += 1
+            backoff = min(backoff * 2, MAX_BACKOFF)
+
+
+def start():
+    """Start the process-wide flush worker if it is not running yet."""
+    global _worker
+    if _worker is not None and _worker.is_alive():
+        return
+    with _lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run, name="sleep-write-behind", daemon=True)
+            _worker.start()
@@ -0,0 +1,24 @@
+"""Inserting nights into sleep_log.
+
+Every path that adds nights (the dashboard form, bulk import, the
+write-behind flush, benchmark data) goes through ``insert_nights`` so the
+monthly rollups and the cohort sums are updated in the same transaction as
+the rows themselves and never miss or double-count a night.
+"""
+from sleep_monitor import cohort, db, rollups
+
+INSERT_SLEEP_LOG = """INSERT INTO sleep_log
+    (user_id, date, sleep_time, wake_time, sleep_quality, notes)
+    VALUES (%s, %s, %s, %s, %s, %s)"""
+
+
+def insert_nights(cursor, rows):
+    """Insert ``(user_id, date, sleep_time, wake_time, quality, notes)`` rows.
+
+    The caller commits; nothing here is visible until it does.
+    """
+    if not rows:
+        return
+    cursor.executemany(db.sql(INSERT_SLEEP_LOG), rows)
+    rollups.add(cursor, rows)
+    cohort.add(cursor, rows)
@@ -0,0 +1,31 @@
+import pytest
+
+from sleep_monitor import cohort, db, migrations, write_queue
+from sleep_monitor.cache import user_cache
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """A fully migrated SQLite database with a private write-behind journal."""
+    db.configure(db.SQLiteBackend(str(tmp_path / "sleep.db")), size=3)
+    migrations.migrate()
+    monkeypatch.setattr(write_queue, "JOURNAL_PATH", str(tmp_path / "queue.db"))
+    # The worker would race the tests for the journal; they flush by hand
+    monkeypatch.setattr(write_queue, "start", lambda: None)
+    monkeypatch.setattr(user_cache, "_entries", type(user_cache._entries)())
+    monkeypatch.setattr(user_cache, "_versions", {})
+    monkeypatch.setattr(user_cache, "_bytes", 0)
+    cohort.reset()
+    yield db.get_backend()
+    cohort.reset()
+    db.get_pool().close()
+
+
+@pytest.fixture
+def users(database):
+    """Ids of three fresh users."""
+    with db.cursor(commit=True) as cursor:
+        cursor.executemany("INSERT INTO users (username, password) VALUES (?, ?)",
+                           [(f"user{n}", "pw") for n in range(3)])
+        cursor.execute("SELECT id FROM users ORDER BY id")
+        return [row[0] for row in cursor.fetchall()]
@@ -0,0 +1,150 @@
+import threading
+from datetime import date, time
+
+import pytest
+
+from sleep_monitor import cohort, db
+from sleep_monitor.writes import insert_nights
+
+
+def _nights(user_id, count, bedtime=time(23, 0), wake=time(7, 0), quality=3, month=1):
+    return [(user_id, date(2025, month, day), bedtime, wake, quality, None) for day in range(1, count + 1)]
+
+
+def _save(rows):
+    with db.cursor(commit=True) as cursor:
+        insert_nights(cursor, rows)
+
+
+def _members():
+    with db.cursor() as cursor:
+        cursor.execute(f"SELECT {', '.join(cohort.MEMBER_COLUMNS)} FROM cohort_member "
+                       "WHERE nights > 0 ORDER BY user_id")
+        return cursor.fetchall()
+
+
+def _delta_ids():
+    with db.cursor() as cursor:
+        cursor.execute("SELECT id FROM cohort_delta ORDER BY id")
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _build():
+    with db.cursor(commit=True) as cursor:
+        return cohort.build(cursor)
+
+
+def test_incremental_sums_match_a_build(users):
+    _save(_nights(users[0], 10))
+    _save(_nights(users[0], 5, time(1, 30), time(9, 0), None, month=2))
+    _save(_nights(users[1], 7, time(22, 0), time(6, 0), 5))
+    incremental = _members()
+
+    assert _build() == 2
+    assert _members() == pytest.approx(incremental)
+    assert _delta_ids() == []
+
+
+def test_each_member_nets_one_delta_per_metric(users):
+    _save(_nights(users[0], 3))
+    _save(_nights(users[0], 3, quality=None, month=2))
+    _save(_nights(users[1], 2, quality=None))
+    with db.cursor() as cursor:
+        cursor.execute("SELECT metric, SUM(weight) FROM cohort_delta GROUP BY metric")
+        net = dict(cursor.fetchall())
+    # users[1] never rated a night, so has no quality average
+    assert net == {"duration": 2, "bedtime": 2, "quality": 1}
+
+
+def test_concurrent_adds_for_one_user_stay_consistent(users):
+    errors = []
+
+    def save(month):
+        try:
+            _save(_nights(users[0], 20, quality=month % 5 + 1, month=month))
+        except Exception as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=save, args=(month,)) for month in range(1, 7)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    (_, nights, _, rated, quality_sum, _), = _members()
+    assert (nights, rated) == (120, 120)
+    assert quality_sum == sum(20 * (month % 5 + 1) for month in range(1, 7))
+    # Every add retracted exactly the average the previous one recorded
+    with db.cursor() as cursor:
+        cursor.execute("SELECT metric, SUM(weight) FROM cohort_delta GROUP BY metric")
+        assert dict(cursor.fetchall()) == {"duration": 1, "bedtime": 1, "quality": 1}
+    people = cohort.population()
+    assert people.users("quality") == pytest.approx(1)
+    assert people.percentile("quality", 3.5) == pytest.approx(100)
+
+
+class _LateDelta:
+    """Cursor that lets another transaction add a night right after build lists the deltas."""
+
+    def __init__(self, cursor, rows):
+        self._cursor = cursor
+        self._rows = rows
+
+    def execute(self, query, *args):
+        self._cursor.execute(query, *args)
+        if query == "SELECT id FROM cohort_delta" and self._rows:
+            _save(self._rows)
+            self._rows = None
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+def test_build_deletes_only_the_deltas_it_folded(users):
+    _save(_nights(users[0], 5))
+    folded = _delta_ids()
+    with db.cursor(commit=True) as cursor:
+        cohort.build(_LateDelta(cursor, _nights(users[1], 5)))
+
+    late = _delta_ids()
+    assert late and not set(late) & set(folded)
+    with db.cursor() as cursor:
+        cursor.execute("SELECT DISTINCT delta_id FROM cohort_sketch")
+        assert [row[0] for row in cursor.fetchall()] == [max(folded)]
+
+
+def test_population_folds_new_deltas(users):
+    _save(_nights(users[0], 5))
+    _build()
+    assert cohort.population().users("duration") == pytest.approx(1)
+
+    _save(_nights(users[1], 5, time(21, 0), time(8, 0)))
+    people = cohort.population()
+    assert people.users("duration") == pytest.approx(2)
+    assert people.watermark == max(_delta_ids())
+    assert cohort.population() is people
+
+
+def test_population_reloads_after_a_rebuild_elsewhere(users):
+    _save(_nights(users[0], 5))
+    before = cohort.population()
+    _save(_nights(users[1], 5))
+    _build()
+
+    after = cohort.population()
+    assert after is not before
+    assert after.users("duration") == pytest.approx(2)
+
+
+def test_standing_moves_with_other_users_saves(users):
+    _save(_nights(users[0], 10, time(23, 0), time(7, 0)))
+    _save(_nights(users[1], 10, time(23, 0), time(5, 0)))
+    _build()
+    duration, percentile = cohort.standing(users[0])["duration"]
+    assert duration == pytest.approx(8)
+    assert percentile > 50
+
+    # users[0]'s own data is unchanged, so only the population marker can expire the entry
+    _save(_nights(users[2], 10, time(20, 0), time(9, 0)))
+    assert cohort.standing(users[0])["duration"][1] < percentile
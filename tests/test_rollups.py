@@ -0,0 +1,90 @@
+import random
+from datetime import date, time, timedelta
+
+import numpy as np
+import pytest
+
+from sleep_monitor import db, loader, metrics, rollups
+from sleep_monitor.writes import insert_nights
+
+
+def _days(grain, first, last):
+    """Every date inside the periods ``first``..``last`` of ``grain``."""
+    days = []
+    period = first
+    while period <= last:
+        if grain == "month":
+            following = rollups._next_month(period)
+        else:
+            following = period + timedelta(days=7 if grain == "week" else 1)
+        days += [period + timedelta(days=n) for n in range((following - period).days)]
+        period = following
+    return days
+
+
+def _check_tiling(start, end):
+    pieces = rollups.cover(start, end)
+    covered = [day for piece in pieces for day in _days(*piece)]
+    assert len(covered) == len(set(covered)), pieces
+    assert sorted(covered) == [start + timedelta(days=n) for n in range((end - start).days + 1)], pieces
+    for grain, first, _ in pieces:
+        if grain == "month":
+            assert first.day == 1
+        elif grain == "week":
+            assert first.weekday() == 0
+
+
+@pytest.mark.parametrize("start, end", [
+    (date(2024, 1, 1), date(2024, 1, 1)),
+    (date(2024, 1, 1), date(2024, 1, 31)),
+    (date(2024, 1, 1), date(2024, 12, 31)),
+    (date(2024, 2, 29), date(2024, 3, 1)),
+    (date(2023, 12, 31), date(2024, 1, 1)),
+    (date(2024, 1, 15), date(2024, 3, 14)),
+    (date(2024, 1, 2), date(2024, 1, 7)),
+    (date(2024, 1, 8), date(2024, 1, 14)),
+])
+def test_cover_tiles_edge_ranges(start, end):
+    _check_tiling(start, end)
+
+
+def test_cover_tiles_random_ranges():
+    rng = random.Random(7)
+    for _ in range(2000):
+        start = date(2020, 1, 1) + timedelta(days=rng.randrange(1500))
+        _check_tiling(start, start + timedelta(days=rng.randrange(800)))
+
+
+def test_range_totals_match_the_raw_nights(users):
+    rng = random.Random(3)
+    rows = []
+    for n in range(400):
+        bedtime = rng.randrange(20 * 60, 26 * 60) % (24 * 60)
+        wake = (bedtime + rng.randrange(5 * 60, 10 * 60)) % (24 * 60)
+        rows.append((users[0], date(2023, 1, 1) + timedelta(days=n),
+                     time(bedtime // 60, bedtime % 60), time(wake // 60, wake % 60),
+                     rng.choice([None, 1, 2, 3, 4, 5]), None))
+    with db.cursor(commit=True) as cursor:
+        insert_nights(cursor, rows)
+    frame = loader.load_after(users[0])
+
+    for start, end in [(date(2023, 1, 1), date(2024, 2, 4)), (date(2023, 3, 17), date(2023, 11, 2)),
+                       (date(2023, 6, 5), date(2023, 6, 11)), (date(2023, 9, 30), date(2023, 10, 1))]:
+        dates = frame['date'].dt.date
+        expected = metrics.totals(frame[(dates >= start) & (dates <= end)])
+        got = rollups.range_totals(users[0], start, end)
+        for key, value in expected.items():
+            np.testing.assert_allclose(got[key], value, rtol=1e-5, err_msg=key)
+
+
+def test_rebuild_matches_incremental_adds(users):
+    rows = [(users[1], date(2024, 5, day), time(23, 30), time(6, 45), day % 5 + 1, None)
+            for day in range(1, 29)]
+    with db.cursor(commit=True) as cursor:
+        insert_nights(cursor, rows)
+    incremental = rollups.range_totals(users[1])
+    with db.cursor(commit=True) as cursor:
+        rollups.rebuild(cursor, [users[1]])
+    rebuilt = rollups.range_totals(users[1])
+    for key, value in incremental.items():
+        np.testing.assert_allclose(rebuilt[key], value, rtol=1e-5, err_msg=key)
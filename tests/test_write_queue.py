@@ -0,0 +1,142 @@
+import threading
+import time as _time
+from datetime import date, time
+
+import pytest
+
+from sleep_monitor import db, write_queue, writes
+
+
+def _queue(user_id, nights):
+    for day in range(1, nights + 1):
+        write_queue.enqueue(user_id, date(2026, 1, day), time(23, 0), time(7, 0), 3, None)
+
+
+def _logged():
+    with db.cursor() as cursor:
+        cursor.execute("SELECT user_id, date FROM sleep_log ORDER BY date")
+        return cursor.fetchall()
+
+
+def _queued():
+    conn = write_queue._journal()
+    try:
+        return conn.execute("SELECT id, claimed_at FROM pending ORDER BY id").fetchall()
+    finally:
+        conn.close()
+
+
+def test_flush_moves_queued_rows(users):
+    _queue(users[0], 3)
+    assert len(write_queue.pending_frame(users[0])) == 3
+    assert (write_queue.pending_frame(users[0])['id'] < 0).all()
+
+    assert write_queue.flush() == 3
+    assert len(_logged()) == 3
+    assert _queued() == []
+    assert len(write_queue.pending_frame(users[0])) == 0
+
+
+def test_replay_after_crash_skips_applied_rows(users):
+    _queue(users[0], 3)
+    # The worker died after its transaction committed but before it cleared the journal
+    conn = write_queue._journal()
+    name, oldest, rows = write_queue._claim(conn, 2)
+    with db.cursor(commit=True) as cursor:
+        write_queue._apply(cursor, name, oldest, rows)
+    conn.execute("UPDATE pending SET claimed_at = NULL")
+    conn.close()
+
+    assert write_queue.flush() == 3
+    assert [row[1] for row in _logged()] == ["2026-01-01", "2026-01-02", "2026-01-03"]
+
+
+def test_applying_the_same_keys_twice_inserts_once(users):
+    _queue(users[0], 2)
+    conn = write_queue._journal()
+    name, oldest, rows = write_queue._claim(conn, 10)
+    conn.close()
+    with db.cursor(commit=True) as cursor:
+        assert write_queue._apply(cursor, name, oldest, rows) == 2
+    with db.cursor(commit=True) as cursor:
+        assert write_queue._apply(cursor, name, oldest, rows) == 0
+    assert len(_logged()) == 2
+
+
+def test_applied_keys_below_the_oldest_queued_row_are_pruned(users):
+    _queue(users[0], 2)
+    write_queue.flush()
+    _queue(users[0], 1)
+    write_queue.flush()
+    with db.cursor() as cursor:
+        cursor.execute("SELECT entry_id FROM write_queue_applied")
+        assert [row[0] for row in cursor.fetchall()] == [3]
+
+
+def test_claimed_rows_are_not_claimed_again(users):
+    _queue(users[0], 2)
+    conn = write_queue._journal()
+    try:
+        assert len(write_queue._claim(conn, 10)[2]) == 2
+        assert write_queue._claim(conn, 10)[2] == []
+    finally:
+        conn.close()
+    assert write_queue.flush() == 0
+
+
+def test_stale_claim_is_taken_over(users):
+    _queue(users[0], 2)
+    conn = write_queue._journal()
+    try:
+        write_queue._claim(conn, 10)
+        conn.execute("UPDATE pending SET claimed_at = ?", (_time.time() - write_queue.CLAIM_TIMEOUT - 1,))
+    finally:
+        conn.close()
+
+    assert write_queue.flush() == 2
+    assert len(_logged()) == 2
+
+
+def test_failed_flush_releases_its_claim(users, monkeypatch):
+    _queue(users[0], 1)
+    insert_nights = writes.insert_nights
+
+    def fail(cursor, rows):
+        raise RuntimeError("database went away")
+
+    monkeypatch.setattr(writes, "insert_nights", fail)
+    with pytest.raises(RuntimeError):
+        write_queue.flush()
+    assert [claimed for _, claimed in _queued()] == [None]
+    assert _logged() == []
+
+    monkeypatch.setattr(writes, "insert_nights", insert_nights)
+    assert write_queue.flush() == 1
+    assert len(_logged()) == 1
+
+
+def test_enqueue_does_not_wait_for_a_flush(users, monkeypatch):
+    _queue(users[0], 1)
+    inserting, release = threading.Event(), threading.Event()
+    insert_nights = writes.insert_nights
+
+    def slow(cursor, rows):
+        inserting.set()
+        release.wait(10)
+        insert_nights(cursor, rows)
+
+    monkeypatch.setattr(writes, "insert_nights", slow)
+    flusher = threading.Thread(target=write_queue.flush)
+    flusher.start()
+    try:
+        assert inserting.wait(10)
+        start = _time.perf_counter()
+        write_queue.enqueue(users[1], date(2026, 2, 1), time(22, 0), time(6, 0), 4, None)
+        assert _time.perf_counter() - start < 5
+    finally:
+        release.set()
+        flusher.join()
+
+    assert len(_logged()) == 1
+    assert write_queue.flush() == 1
+    assert len(_logged()) == 2